@@ -0,0 +1,60 @@
+"""Compare memory use and throughput of DedupeWindow and BloomWindow.
+
+Usage: python benchmarks/dedupe_window.py [ENTRIES]
+"""
+import sys
+import tracemalloc
+from time import perf_counter
+from uuid import uuid4
+
+from qpid_bow.dedupe import BloomWindow, DedupeWindow, Window
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    # Message IDs as created by create_message
+    keys = [uuid4() for _ in range(entries)]
+    unseen_keys = [uuid4() for _ in range(entries)]
+
+    windows = {
+        'lru': lambda: DedupeWindow(max_entries=entries),
+        'bloom': lambda: BloomWindow(entries),
+    }
+    for name, create_window in windows.items():
+        window = create_window()
+        start = perf_counter()
+        fill(window, keys)
+        duration = perf_counter() - start
+
+        report(name, duration, measure_memory(create_window, keys), entries,
+               sum(key in window for key in unseen_keys))
+
+
+def fill(window: Window, keys):
+    for key in keys:
+        window.seen(key)
+
+
+def measure_memory(create_window, keys) -> int:
+    # Tracing slows down filling, so memory is measured in a separate run
+    tracemalloc.start()
+    window = create_window()
+    fill(window, keys)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del window
+    return memory
+
+
+def report(name: str, duration: float, memory: int, entries: int,
+           false_duplicate_count: int):
+    print(f'{name:>6}: {entries / duration:.0f} msg/s, '
+          f'{memory / 1024 ** 2:.1f} MiB for {entries} entries, '
+          f'{false_duplicate_count} false duplicates')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
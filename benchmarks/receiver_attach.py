@@ -0,0 +1,66 @@
+"""Measure time and memory to attach a Receiver to many addresses, with its
+links on one or spread over multiple sessions.
+
+Re-attaching after a reconnect takes the same path as the initial attach.
+Tracing memory slows down attaching, equally for each amount of sessions.
+
+Usage: python benchmarks/receiver_attach.py [ADDRESSES] [SESSIONS]
+"""
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import List
+from uuid import uuid4
+
+from qpid_bow.management.queue import create_queue
+from qpid_bow.receiver import Receiver
+
+SERVER_URL = '127.0.0.1'
+
+
+class AttachCountingReceiver(Receiver):
+    """Receiver counting the links attached by the broker."""
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.attached = 0
+
+    def on_link_opened(self, event):  # pylint: disable=unused-argument
+        self.attached += 1
+
+
+def main():
+    addresses = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    queue_names = [uuid4().hex for _ in range(addresses)]
+    for queue_name in queue_names:
+        create_queue(queue_name, durable=False, auto_delete=True,
+                     extra_properties={'qpid.auto_delete_timeout': 60},
+                     server_url=SERVER_URL)
+
+    for session_count in sorted({1, sessions}):
+        measure(f'{session_count} session(s)', queue_names, session_count)
+
+
+def measure(name: str, queue_names: List[str], sessions: int):
+    tracemalloc.start()
+    start = perf_counter()
+    receiver = AttachCountingReceiver(lambda message: True,
+                                      server_url=SERVER_URL,
+                                      sessions=sessions)
+    receiver.add_addresses(queue_names)
+    receiver.open()
+    receiver.process_until(lambda: receiver.attached >= len(queue_names))
+    duration = perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    receiver.close()
+
+    print(f'{name:>12}: attached {receiver.attached} addresses in '
+          f'{duration:.2f}s, {memory / 1024 ** 2:.1f} MiB')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
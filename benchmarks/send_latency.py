@@ -0,0 +1,57 @@
+"""Compare per-call latency of Sender.send() with and without persistent
+connections.
+
+Usage: python benchmarks/send_latency.py [CALLS] [BATCH_SIZE]
+"""
+import sys
+from statistics import mean, median
+from time import perf_counter
+from uuid import uuid4
+
+from qpid_bow.management.queue import create_queue
+from qpid_bow.message import create_message
+from qpid_bow.sender import Sender
+
+SERVER_URL = '127.0.0.1'
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    queue_name = uuid4().hex
+    create_queue(queue_name, durable=False, auto_delete=True,
+                 extra_properties={'qpid.auto_delete_timeout': 10},
+                 server_url=SERVER_URL)
+
+    report('default', measure(Sender(queue_name, SERVER_URL),
+                              calls, batch_size))
+
+    sender = Sender(queue_name, SERVER_URL, persistent=True)
+    report('persistent', measure(sender, calls, batch_size))
+    sender.close()
+
+
+def measure(sender: Sender, calls: int, batch_size: int) -> list:
+    timings = []
+    for _ in range(calls):
+        sender.queue([create_message(b'benchmark')
+                      for _ in range(batch_size)])
+        start = perf_counter()
+        sender.send()
+        timings.append(perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f'{name:>12}: mean {mean(timings) * 1000:.2f}ms, '
+          f'median {median(timings) * 1000:.2f}ms, '
+          f'p99 {p99 * 1000:.2f}ms over {len(timings)} calls')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,49 @@
+"""Compare throughput of Sender in its default, confirmed and pre-settled
+modes.
+
+Usage: python benchmarks/send_throughput.py [MESSAGES]
+"""
+import sys
+from time import perf_counter
+from uuid import uuid4
+
+from qpid_bow.management.queue import create_queue
+from qpid_bow.message import create_message
+from qpid_bow.sender import Sender
+
+SERVER_URL = '127.0.0.1'
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    modes = {
+        'default': {},
+        'confirmed': {'confirm_window': 1000},
+        'presettled': {'presettled': True},
+    }
+    for name, options in modes.items():
+        queue_name = uuid4().hex
+        create_queue(queue_name, durable=False, auto_delete=True,
+                     extra_properties={'qpid.auto_delete_timeout': 10},
+                     server_url=SERVER_URL)
+        report(name, measure(Sender(queue_name, SERVER_URL, **options),
+                             messages), messages)
+
+
+def measure(sender: Sender, messages: int) -> float:
+    sender.queue(create_message(b'benchmark') for _ in range(messages))
+    start = perf_counter()
+    sender.send()
+    return perf_counter() - start
+
+
+def report(name: str, duration: float, messages: int):
+    print(f'{name:>12}: {messages / duration:.0f} msg/s, '
+          f'{duration:.2f}s for {messages} messages')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
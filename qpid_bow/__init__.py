@@ -3,11 +3,11 @@
 from asyncio import Event as AsyncioEvent
 from enum import Enum, auto
 from logging import getLogger
-from typing import Optional, Type
+from typing import Callable, Optional, Type
 
 from proton import Connection
 from proton.handlers import MessagingHandler
-from proton.reactor import Container, Backoff, EventBase
+from proton.reactor import Container, Backoff, EventBase, Task
 
 from qpid_bow.config import (
     config,
@@ -16,6 +16,9 @@ from qpid_bow.config import (
 
 logger = getLogger()
 
+# Maximum seconds a blocking container waits for I/O per processing round
+PROCESS_TIMEOUT = 3.14159265359
+
 
 class Priority(Enum):
     """Convenience enum for message priorities.
@@ -55,6 +58,19 @@ class ReconnectStrategy(Enum):
     disabled = False
 
 
+class ScheduledCallback:
+    """Reactor timer task handler calling a function when the timer fires.
+
+    Args:
+        callback: Function to call.
+    """
+    def __init__(self, callback: Callable[[], None]) -> None:
+        self.callback = callback
+
+    def on_timer_task(self, event: EventBase):  # pylint: disable=unused-argument
+        self.callback()
+
+
 class Connector(MessagingHandler):
     """Initiate and keep connection to AMQP message broker.
 
@@ -64,13 +80,16 @@ class Connector(MessagingHandler):
             should be the primary server.
         container_class: Qpid Proton reactor container-class to use.
         reconnect_strategy: Strategy to use on connection drop.
+        prefetch: Credit to keep issued on receiving links, 0 to leave
+            issuing credit to the subclass.
     """
     def __init__(
             self, server_url: Optional[str] = None,
             container_class: Type[Container] = Container,
-            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.backoff
+            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.backoff,
+            prefetch: int = 10
         ) -> None:
-        super().__init__(auto_accept=False)
+        super().__init__(prefetch=prefetch, auto_accept=False)
         self.server_urls = get_urls(server_url)
 
         self.run_state = RunState.stopped
@@ -87,6 +106,7 @@ class Connector(MessagingHandler):
 
         self.connection: Connection
         self.container: Container
+        self.process_condition: Optional[Callable[[], bool]] = None
 
     def touch(self):
         """Instruct the reactor container to do processing.
@@ -99,6 +119,18 @@ class Connector(MessagingHandler):
         except (AttributeError, NameError):
             pass
 
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Task:
+        """Schedule a function to be called by the reactor container.
+
+        Args:
+            delay: Seconds to wait before calling.
+            callback: Function to call.
+
+        Returns:
+            Task: Scheduled reactor task, which can be cancelled.
+        """
+        return self.container.schedule(delay, ScheduledCallback(callback))
+
     def on_start(self, event: EventBase):
         """Handle start event.
 
@@ -151,6 +183,66 @@ class Connector(MessagingHandler):
         self.container = self.container_class(self)
         self.container.run()
 
+    def open(self):
+        """Start this Connector and setup connection to the AMQP server
+        without handing over control to the container.
+
+        Use :obj:`process_until` to let the container do its processing.
+        """
+        self.container = self.container_class(self)
+        self.container.start()
+        self.touch()
+
+    def process_until(self, condition: Callable[[], bool]):
+        """Let the container process events until condition is met, the
+        connection failed or the container has nothing left to process.
+
+        Containers running on an event loop, like the AsyncioContainer, do
+        their processing in the loop and only get touched.
+
+        Args:
+            condition: Function returning True when processing can end.
+        """
+        if hasattr(self.container, 'loop'):
+            self.touch()
+            return
+
+        self.process_condition = condition
+        try:
+            while not condition() and self.run_state != RunState.failed:
+                self.container.timeout = PROCESS_TIMEOUT
+                if not self.container.process():
+                    break
+        finally:
+            self.process_condition = None
+
+    def on_reactor_quiesced(self, event: EventBase):
+        """Handle reactor quiesced event, just before waiting for I/O.
+
+        Args:
+            event: Reactor quiesced event.
+        """
+        if self.process_condition and self.process_condition():
+            # Don't wait for I/O, return control from process_until
+            event.reactor.timeout = 0
+            event.reactor.yield_()
+
+    def close(self):
+        """Stop connection to the AMQP server and wait for it to be closed.
+
+        Counterpart of :obj:`open`, use :obj:`stop` from within event handlers.
+        """
+        if self.run_state == RunState.stopped:
+            return
+
+        self.stop()
+        if hasattr(self.container, 'loop'):
+            return
+
+        self.process_until(lambda: self.run_state == RunState.stopped)
+        self.container.stop()
+        self.container.process()
+
     def stop(self):
         """Stop connection to the AMQP server."""
         if self.run_state not in (RunState.started,
@@ -0,0 +1,55 @@
+from datetime import timedelta
+from functools import partial
+from importlib import import_module
+from os import EX_USAGE, cpu_count
+
+from qpid_bow.receiver import Receiver
+from qpid_bow.runner import ConsumerRunner
+
+
+def message_consume_parser(action):
+    parser = action.add_parser(
+        'consume', help="Consume messages in multiple worker processes")
+    parser.set_defaults(parser=parser)
+    parser.set_defaults(func=message_consume)
+
+    parser.add_argument('address', metavar='ADDRESS', type=str,
+                        help="Queue or exchange address from where to receive "
+                             "messages")
+    parser.add_argument('callback', metavar='CALLBACK', type=str,
+                        help="Function to call with each message, as "
+                             "module:function")
+    parser.add_argument('-b', '--broker-url', type=str, required=False,
+                        help="amqp:// or amqps:// URL to the broker")
+    parser.add_argument('-w', '--workers', type=int, required=False,
+                        default=cpu_count(),
+                        help="Amount of worker processes")
+    parser.add_argument('-r', '--report-interval', type=float,
+                        required=False, default=10,
+                        help="Seconds between throughput reports")
+
+
+def message_consume(args):
+    module_name, _, function_name = args.callback.partition(':')
+    try:
+        callback = getattr(import_module(module_name), function_name)
+    except (ImportError, AttributeError, ValueError):
+        print(f"Can not import callback {args.callback}\n")
+        args.parser.print_help()
+        exit(EX_USAGE)
+
+    last_total = 0
+
+    def report(stats):
+        nonlocal last_total
+        total = sum(stats.values())
+        rate = (total - last_total) / args.report_interval
+        last_total = total
+        print(f"{rate:.1f} msg/s, " +
+              ", ".join(f"{name}: {count}" for name, count in stats.items()))
+
+    runner = ConsumerRunner(
+        partial(Receiver, callback, args.address, args.broker_url),
+        args.workers, report_callback=report,
+        report_interval=timedelta(seconds=args.report_interval))
+    runner.run()
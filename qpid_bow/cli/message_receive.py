@@ -1,3 +1,4 @@
+from qpid_bow.filters import link_filter
 from qpid_bow.receiver import Receiver
 
 
@@ -14,6 +15,9 @@ def message_receive_parser(action):
                         help="amqp:// or amqps:// URL to the broker")
     parser.add_argument('-c', '--count', type=int, required=False, default=1,
                         help="How many messages to receive")
+    parser.add_argument('-s', '--selector', type=str, required=False,
+                        help="Only receive messages matching this JMS-style "
+                             "selector, filtered by the broker")
 
 
 def message_receive(args):
@@ -21,5 +25,8 @@ def message_receive(args):
         print(message.body)
         return True
 
-    receiver = Receiver(callback, args.address, args.broker_url, args.count)
+    receiver = Receiver(callback, server_url=args.broker_url,
+                        limit=args.count)
+    options = [link_filter(selector=args.selector)] if args.selector else None
+    receiver.add_address(args.address, options=options)
     receiver.receive()
@@ -4,6 +4,7 @@ from itertools import repeat
 from os import EX_DATAERR
 
 from qpid_bow.message import create_message
+from qpid_bow.rate_limit import TokenBucket
 from qpid_bow.sender import Sender
 
 
@@ -22,6 +23,11 @@ def message_send_parser(action):
     parser.add_argument('-p', '--properties-file', type=FileType('r'),
                         required=False, default=None,
                         help="Message properties file (JSON)")
+    parser.add_argument('--rate', type=float, required=False, default=None,
+                        help="Maximum messages to send per second")
+    parser.add_argument('--byte-rate', type=float, required=False,
+                        default=None,
+                        help="Maximum message bytes to send per second")
     parser.add_argument('message', type=str, help="Message to send")
 
 
@@ -36,6 +42,9 @@ def message_send(args):
             exit(EX_DATAERR)
 
     message = create_message(args.message.encode(), properties)
-    sender = Sender(args.address, args.broker_url)
+    rate_limit = TokenBucket(args.rate) if args.rate else None
+    byte_rate_limit = TokenBucket(args.byte_rate) if args.byte_rate else None
+    sender = Sender(args.address, args.broker_url, rate_limit=rate_limit,
+                    byte_rate_limit=byte_rate_limit)
     sender.queue(repeat(message, args.repeat))
     sender.send()
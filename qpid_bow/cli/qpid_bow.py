@@ -10,6 +10,7 @@ from typing import (
 )
 
 from qpid_bow.cli.connection_kill import connection_kill_parser
+from qpid_bow.cli.message_consume import message_consume_parser
 from qpid_bow.cli.message_receive import message_receive_parser
 from qpid_bow.cli.message_send import message_send_parser
 from qpid_bow.cli.queue_create import queue_create_parser
@@ -34,7 +35,8 @@ def main():
                     queue_stats_parser))
 
     create_command('message', 'Manage messages', action,
-                   (message_receive_parser, message_send_parser))
+                   (message_consume_parser, message_receive_parser,
+                    message_send_parser))
 
     create_command('route', 'Manage routes', action,
                    (route_dump_parser, route_config_parser))
@@ -0,0 +1,86 @@
+"""Message body compression."""
+
+import lzma
+import zlib
+from typing import Callable, Dict, NamedTuple
+
+from proton import Data, Message
+
+# Minimum encoded body size in bytes before a body gets compressed
+COMPRESSION_THRESHOLD = 4096
+
+
+class Codec(NamedTuple):
+    """Pair of functions to compress and decompress bytes."""
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+# Codecs by the name used as message content encoding
+CODECS: Dict[str, Codec] = {
+    'zlib': Codec(zlib.compress, zlib.decompress),
+    'lzma': Codec(lzma.compress, lzma.decompress),
+}
+
+
+def register_codec(name: str, compress: Callable[[bytes], bytes],
+                   decompress: Callable[[bytes], bytes]):
+    """Register a codec to compress and decompress message bodies with.
+
+    Args:
+        name: Name of the codec, used as message content encoding.
+        compress: Function to compress bytes.
+        decompress: Function to decompress bytes.
+    """
+    CODECS[name] = Codec(compress, decompress)
+
+
+def compress_message(message: Message, codec: str,
+                     threshold: int = COMPRESSION_THRESHOLD) -> Message:
+    """Compress the body of a message when it exceeds a size threshold.
+
+    The body is AMQP-encoded before compressing, to keep its type on
+    decompression, and the codec name is set as content encoding.
+
+    Args:
+        message: Message to compress.
+        codec: Name of the codec to compress with.
+        threshold: Minimum encoded body size in bytes to compress.
+
+    Returns:
+        Message: The given message, compressed in place.
+    """
+    compress = CODECS[codec].compress
+    data = Data()
+    data.put_object(message.body)
+    encoded_body = data.encode()
+    if len(encoded_body) < threshold:
+        return message
+
+    message.body = compress(encoded_body)
+    message.content_encoding = codec
+    return message
+
+
+def decompress_message(message: Message) -> Message:
+    """Decompress the body of a message compressed with a known codec.
+
+    Messages with another or no content encoding are left as is.
+
+    Args:
+        message: Message to decompress.
+
+    Returns:
+        Message: The given message, decompressed in place.
+    """
+    codec = CODECS.get(message.content_encoding)
+    if codec is None:
+        return message
+
+    data = Data()
+    data.decode(codec.decompress(message.body))
+    data.rewind()
+    data.next()
+    message.body = data.get_object()
+    message.content_encoding = None
+    return message
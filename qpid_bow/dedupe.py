@@ -0,0 +1,148 @@
+"""Bounded windows to detect duplicate messages."""
+
+from collections import OrderedDict
+from datetime import timedelta
+from hashlib import blake2b
+from math import ceil, log
+from time import monotonic
+from typing import Hashable, Iterator, Optional, Union
+
+
+class DedupeWindow:
+    """Remembers recently seen keys, like message IDs, to detect duplicates.
+
+    The window is bounded by the amount of keys it remembers, the time it
+    remembers them or both. When full, the oldest keys are forgotten first.
+
+    Args:
+        max_entries: Maximum amount of keys to remember.
+        max_age: Maximum duration to remember a key.
+    """
+    def __init__(self, max_entries: Optional[int] = None,
+                 max_age: Optional[timedelta] = None) -> None:
+        if not max_entries and not max_age:
+            raise ValueError("DedupeWindow requires max_entries or max_age")
+
+        self.max_entries = max_entries
+        self.max_age = max_age.total_seconds() if max_age else None
+        self.entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._expire()
+        return key in self.entries
+
+    def seen(self, key: Hashable) -> bool:
+        """Check if key was seen within the window, remembering it if not.
+
+        Args:
+            key: Key to check, like a message ID.
+
+        Returns:
+            bool: True when the key is a duplicate.
+        """
+        self._expire()
+        if key in self.entries:
+            return True
+
+        self.entries[key] = monotonic()
+        if self.max_entries and len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return False
+
+    def _expire(self):
+        if not self.max_age:
+            return
+
+        expire_before = monotonic() - self.max_age
+        while self.entries:
+            oldest_key = next(iter(self.entries))
+            if self.entries[oldest_key] > expire_before:
+                break
+            del self.entries[oldest_key]
+
+
+class BloomWindow:
+    """Remembers recently seen keys in Bloom filters, using a fraction of the
+    memory of a DedupeWindow for large windows.
+
+    Keys are remembered in generations of capacity keys each. When the
+    current generation is full, the previous one is forgotten, so between
+    capacity and twice capacity of the most recent keys are remembered.
+    Unlike a DedupeWindow, a key never seen may be reported as a duplicate,
+    with a chance of about error_rate per generation.
+
+    Args:
+        capacity: Amount of keys to remember per generation.
+        error_rate: Chance of a false duplicate per generation.
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        if capacity <= 0:
+            raise ValueError("BloomWindow requires a positive capacity")
+        if not 0 < error_rate < 1:
+            raise ValueError("BloomWindow requires an error rate between 0 "
+                             "and 1")
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Optimal amount of bits and hash functions for the error rate
+        self.bits = ceil(-capacity * log(error_rate) / log(2) ** 2)
+        self.hashes = max(1, round(self.bits / capacity * log(2)))
+        self.current = bytearray((self.bits + 7) // 8)
+        self.previous = bytearray(len(self.current))
+        self.current_count = 0
+        self.previous_count = 0
+
+    def __len__(self) -> int:
+        return self.current_count + self.previous_count
+
+    def __contains__(self, key: Hashable) -> bool:
+        positions = list(self._positions(key))
+        return (self._test(self.current, positions) or
+                self._test(self.previous, positions))
+
+    def seen(self, key: Hashable) -> bool:
+        """Check if key was seen within the window, remembering it if not.
+
+        Args:
+            key: Key to check, like a message ID.
+
+        Returns:
+            bool: True when the key is, or with a chance of error_rate
+            falsely appears to be, a duplicate.
+        """
+        positions = list(self._positions(key))
+        if (self._test(self.current, positions) or
+                self._test(self.previous, positions)):
+            return True
+
+        if self.current_count >= self.capacity:
+            self.previous = self.current
+            self.previous_count = self.current_count
+            self.current = bytearray(len(self.previous))
+            self.current_count = 0
+
+        for position in positions:
+            self.current[position >> 3] |= 1 << (position & 7)
+        self.current_count += 1
+        return False
+
+    def _positions(self, key: Hashable) -> Iterator[int]:
+        # Double hashing, deriving all hash functions from one digest
+        digest = blake2b(repr(key).encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.bits
+
+    @staticmethod
+    def _test(generation: bytearray, positions) -> bool:
+        for position in positions:
+            if not generation[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+Window = Union[DedupeWindow, BloomWindow]
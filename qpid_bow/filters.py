@@ -0,0 +1,50 @@
+"""Broker-side filters for receiver links."""
+
+from typing import Any, Dict, Optional
+
+from proton import Described, symbol
+from proton.reactor import Filter
+
+# Filter descriptors as supported by Qpid brokers
+SELECTOR_FILTER = symbol('apache.org:selector-filter:string')
+SUBJECT_FILTER = symbol('apache.org:legacy-amqp-topic-binding:string')
+HEADERS_FILTER = symbol('apache.org:legacy-amqp-headers-binding:map')
+
+
+def link_filter(selector: Optional[str] = None,
+                subject: Optional[str] = None,
+                headers: Optional[Dict[str, Any]] = None,
+                match_all: bool = True) -> Filter:
+    """Create a link option having the broker only send matching messages.
+
+    Pass the result to :meth:`qpid_bow.receiver.Receiver.add_address`.
+    Messages not matching stay on the queue for other receivers, instead of
+    being sent to this receiver only to be rejected.
+
+    Args:
+        selector: JMS-style selector on message headers and properties, like
+            ``"priority > 4 AND region = 'eu'"``.
+        subject: Topic pattern the message subject has to match, like
+            ``"orders.*.created"``, for receiving from a topic exchange.
+        headers: Properties and values messages have to carry, for receiving
+            from a headers exchange.
+        match_all: Require all headers to match, instead of any of them.
+
+    Returns:
+        Filter: Link option setting the filters on the link source.
+    """
+    filter_set = {}
+    if selector is not None:
+        filter_set[symbol('selector')] = Described(SELECTOR_FILTER, selector)
+    if subject is not None:
+        filter_set[symbol('subject')] = Described(SUBJECT_FILTER, subject)
+    if headers is not None:
+        filter_set[symbol('headers')] = Described(
+            HEADERS_FILTER,
+            dict(headers, **{'x-match': 'all' if match_all else 'any'}))
+
+    if not filter_set:
+        raise ValueError("A link filter requires a selector, subject or "
+                         "headers")
+
+    return Filter(filter_set)
@@ -1,13 +1,25 @@
 """Message utility methods."""
 
 from copy import copy
-from typing import Optional, Union
+from hashlib import sha256
+from time import monotonic
+from typing import Any, Iterable, List, Optional, Union
+from uuid import UUID
 
-from proton import Message
+from proton import Data, Message
 
 from qpid_bow import Priority
+from qpid_bow.compression import COMPRESSION_THRESHOLD, compress_message
 from qpid_bow.exc import UnroutableMessage
 
+BATCH_CONTENT_TYPE = 'application/x-qpid-bow-batch'
+
+# Bytes of the fixed-width AMQP type encodings by constructor subcategory
+FIXED_WIDTHS = {0x4: 0, 0x5: 1, 0x6: 2, 0x7: 4, 0x8: 8, 0x9: 16}
+# Descriptor codes of the AMQP body sections, data, sequence and value, and
+# the footer following them
+BODY_SECTION_CODES = frozenset((0x75, 0x76, 0x77, 0x78))
+
 
 def decode_message(data: bytes) -> Message:
     """Utility method to decode message from bytes.
@@ -23,15 +35,94 @@ def decode_message(data: bytes) -> Message:
     return message
 
 
+def _value_end(data: bytes, offset: int) -> int:
+    """Find the end of the AMQP-encoded value at offset, without decoding
+    it."""
+    constructor = data[offset]
+    offset += 1
+    if constructor == 0x00:  # Described value, skip descriptor and value
+        return _value_end(data, _value_end(data, offset))
+
+    subcategory = constructor >> 4
+    if subcategory in FIXED_WIDTHS:
+        return offset + FIXED_WIDTHS[subcategory]
+
+    # Variable width, compound and array values start with their size
+    size_width = 1 if subcategory in (0xa, 0xc, 0xe) else 4
+    size = int.from_bytes(data[offset:offset + size_width], 'big')
+    return offset + size_width + size
+
+
+def body_offset(data: bytes) -> int:
+    """Find where the body starts in an AMQP-encoded message.
+
+    Args:
+        data: Raw AMQP data in bytes.
+
+    Returns:
+        int: Offset of the first body section, or of the first section with
+        an unknown descriptor.
+    """
+    offset = 0
+    while offset < len(data):
+        if data[offset] != 0x00 or data[offset + 1] != 0x53:
+            # Not a section with a small ulong descriptor
+            return offset
+        if data[offset + 2] in BODY_SECTION_CODES:
+            return offset
+        offset = _value_end(data, offset)
+
+    return offset
+
+
+class LazyMessage(Message):
+    """Message of which the body is only decoded when it is accessed.
+
+    Args:
+        data: Raw AMQP data in bytes.
+    """
+    def __init__(self, data: bytes) -> None:
+        self._body = None
+        self._encoded: Optional[bytes] = None
+        super().__init__()
+        # Decode all sections up to the body
+        self.decode(data[:body_offset(data)])
+        self._encoded = data
+
+    @property  # type: ignore
+    def body(self):
+        if self._encoded is not None:
+            self._body = decode_message(self._encoded).body
+            self._encoded = None
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._encoded = None
+        self._body = value
+
+    @property
+    def body_decoded(self) -> bool:
+        """Whether the body is decoded."""
+        return self._encoded is None
+
+
 def create_message(body: Union[str, bytes, dict, list],
                    properties: Optional[dict] = None,
-                   priority: Priority = Priority.normal) -> Message:
+                   priority: Priority = Priority.normal,
+                   compression: Optional[str] = None,
+                   compression_threshold: int = COMPRESSION_THRESHOLD
+                   ) -> Message:
     """Utility method to create message with common attributes.
 
     Args:
         body: Message body.
         properties: Message properties.
         priority: Message priority.
+        compression: Name of the codec to compress the body with, see
+            :obj:`qpid_bow.compression.CODECS`.
+        compression_threshold: Minimum encoded body size in bytes to
+            compress.
 
     Returns:
         Message: Created message.
@@ -43,9 +134,104 @@ def create_message(body: Union[str, bytes, dict, list],
     else:
         message.content_type = None
 
+    if compression:
+        compress_message(message, compression, compression_threshold)
+
     return message
 
 
+def content_id(message: Message, properties: Iterable[str] = (),
+               include_address: bool = False) -> UUID:
+    """Derive a message ID from the content of a message.
+
+    Messages with an identical body and identical values for the selected
+    properties get the same ID.
+
+    Args:
+        message: Message to derive the ID for.
+        properties: Names of the message properties to include.
+        include_address: Include Message.address, for messages of identical
+            content sent to different addresses to get different IDs.
+
+    Returns:
+        UUID: Message ID based on a SHA-256 hash of the message content.
+    """
+    message_properties = message.properties or {}
+    data = Data()
+    data.put_object(message.body)
+    for name in properties:
+        data.put_object(name)
+        data.put_object(message_properties.get(name))
+    if include_address:
+        data.put_object(message.address)
+
+    return UUID(bytes=sha256(data.encode()).digest()[:16])
+
+
+class MessageBatch:
+    """Collects messages to be sent together in a single batch envelope.
+
+    A batch envelope is an AMQP message with content type
+    ``application/x-qpid-bow-batch``, of which the body is a list with each
+    message AMQP-encoded as binary. The envelope is durable when any of its
+    messages is and gets the highest priority of its messages.
+
+    Args:
+        address: Address to send the envelope to.
+    """
+    def __init__(self, address: Optional[str] = None) -> None:
+        self.address = address
+        self.encoded_messages: List[bytes] = []
+        # IDs of the added messages
+        self.message_ids: List[Any] = []
+        self.size = 0
+        self.durable = False
+        self.priority = Priority.internal_low.value
+        self.created = monotonic()
+
+    def __len__(self) -> int:
+        return len(self.encoded_messages)
+
+    def add(self, message: Message):
+        """Add message to the batch.
+
+        Args:
+            message: Message to add.
+        """
+        encoded_message = message.encode()
+        self.encoded_messages.append(encoded_message)
+        self.message_ids.append(message.id)
+        self.size += len(encoded_message)
+        self.durable = self.durable or message.durable
+        self.priority = max(self.priority, message.priority)
+
+    def create_envelope(self) -> Message:
+        """Create the batch envelope message.
+
+        Returns:
+            Message: Batch envelope containing all added messages.
+        """
+        return Message(body=self.encoded_messages, address=self.address,
+                       durable=self.durable, priority=self.priority,
+                       content_type=BATCH_CONTENT_TYPE)
+
+
+def unpack_batch(message: Message) -> List[Message]:
+    """Utility method to unpack the messages of a batch envelope.
+
+    Args:
+        message: Batch envelope, or any other message.
+
+    Returns:
+        List[Message]: Messages contained by the envelope, or just the given
+        message when it is no batch envelope.
+    """
+    if message.content_type != BATCH_CONTENT_TYPE:
+        return [message]
+
+    return [decode_message(data) for data in message.body]
+
+
 def create_reply(origin_message: Message,
                  result_data: Union[str, bytes, dict, list]) -> Message:
     """Create reply to origin message with result data.
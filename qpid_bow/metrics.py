@@ -0,0 +1,189 @@
+"""Metrics of sent and received messages, with Prometheus text export."""
+
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+# Metric types and help texts by name
+METRICS = {
+    'received_total': ('counter', "Messages received"),
+    'settled_total': ('counter', "Received messages settled by outcome"),
+    'callback_seconds': ('histogram', "Duration of receive callbacks"),
+    'in_flight': ('gauge', "Received messages being processed"),
+    'duplicates_total': ('counter', "Duplicate messages accepted unprocessed"),
+    'sent_total': ('counter', "Messages sent"),
+    'confirmed_total': ('counter', "Sent messages confirmed by outcome"),
+    'unsettled': ('gauge', "Sent messages waiting for confirmation"),
+}
+
+# Metric key: name, address and optional outcome
+MetricKey = Tuple[str, Optional[str], Optional[str]]
+
+
+class Histogram:
+    """Counts observed values in buckets by upper bound.
+
+    Args:
+        buckets: Sorted upper bounds of the buckets.
+    """
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        # Last count is for values exceeding all bounds
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Count a value.
+
+        Args:
+            value: Value to count.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[int]:
+        """Get the amount of values up to each bound, ending with all values.
+
+        Returns:
+            List[int]: Cumulative counts.
+        """
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class Metrics:
+    """Collects metrics of Senders and Receivers keyed by address.
+
+    Pass an instance to a Sender or Receiver to enable collecting metrics,
+    one instance can be shared between them.
+
+    Args:
+        buckets: Upper bounds in seconds of the latency histogram buckets.
+        prefix: Prefix of the metric names.
+    """
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 prefix: str = 'qpid_bow') -> None:
+        self.buckets = sorted(buckets)
+        self.prefix = prefix
+        self.counters: DefaultDict[MetricKey, float] = defaultdict(float)
+        self.gauges: Dict[MetricKey, float] = {}
+        self.histograms: Dict[MetricKey, Histogram] = {}
+
+    def increment(self, name: str, address: Optional[str],
+                  outcome: Optional[str] = None, amount: float = 1):
+        """Increment a counter.
+
+        Args:
+            name: Metric name.
+            address: Address the metric applies to.
+            outcome: Outcome of settled messages.
+            amount: Amount to increment with.
+        """
+        self.counters[(name, address, outcome)] += amount
+
+    def set(self, name: str, address: Optional[str], value: float):
+        """Set a gauge.
+
+        Args:
+            name: Metric name.
+            address: Address the metric applies to.
+            value: Current value.
+        """
+        self.gauges[(name, address, None)] = value
+
+    def observe(self, name: str, address: Optional[str], value: float):
+        """Count a value in a histogram.
+
+        Args:
+            name: Metric name.
+            address: Address the metric applies to.
+            value: Value to count.
+        """
+        key = (name, address, None)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Get the current values of all metrics.
+
+        Returns:
+            Dict[str, List[Dict[str, Any]]]: Per metric name a list of
+            samples, with their labels and either a value or for histograms
+            the count, sum and cumulative count per bucket bound.
+        """
+        snapshot: DefaultDict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for metrics in (self.counters, self.gauges):
+            for key, value in metrics.items():  # type: ignore
+                snapshot[key[0]].append(
+                    {'labels': self._labels(key), 'value': value})
+
+        for key, histogram in self.histograms.items():
+            snapshot[key[0]].append({
+                'labels': self._labels(key),
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'buckets': dict(zip(self.buckets + [float('inf')],
+                                    histogram.cumulative_counts())),
+            })
+
+        return dict(snapshot)
+
+    def prometheus(self) -> str:
+        """Export all metrics in the Prometheus text format.
+
+        Returns:
+            str: Metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, samples in sorted(self.snapshot().items()):
+            metric_type, help_text = METRICS.get(name, ('untyped', name))
+            full_name = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+            for sample in samples:
+                labels = sample['labels']
+                if 'buckets' not in sample:
+                    lines.append(f"{full_name}{_format_labels(labels)} "
+                                 f"{sample['value']}")
+                    continue
+
+                for bound, count in sample['buckets'].items():
+                    bucket_labels = dict(labels, le=_format_bound(bound))
+                    lines.append(f"{full_name}_bucket"
+                                 f"{_format_labels(bucket_labels)} {count}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} "
+                             f"{sample['sum']}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} "
+                             f"{sample['count']}")
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(key: MetricKey) -> Dict[str, str]:
+        labels = {'address': key[1] or ''}
+        if key[2] is not None:
+            labels['outcome'] = key[2]
+        return labels
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"')
+               .replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value
+                          in zip(labels, escaped)) + '}'
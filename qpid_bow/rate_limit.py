@@ -0,0 +1,52 @@
+"""Token buckets to limit sending rates."""
+
+from time import monotonic
+from typing import Optional
+
+
+class TokenBucket:
+    """Limits a rate, like messages or bytes per second, with a burst
+    allowance.
+
+    The bucket refills at the given rate up to its burst size. Consuming may
+    take the bucket into debt, which has to be refilled before consuming
+    again. This allows limiting by amounts only known after consuming, like
+    the encoded size of a message.
+
+    Args:
+        rate: Amount of tokens to refill per second.
+        burst: Maximum amount of tokens to hold, defaults to one second worth
+            of tokens.
+    """
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("TokenBucket requires a positive rate")
+
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.updated = monotonic()
+
+    def consume(self, amount: float = 1):
+        """Consume tokens from the bucket.
+
+        Args:
+            amount: Amount of tokens to consume.
+        """
+        self._refill()
+        self.tokens -= amount
+
+    def wait_time(self) -> float:
+        """Get the time until tokens can be consumed again.
+
+        Returns:
+            float: Seconds to wait, 0 when tokens are available.
+        """
+        self._refill()
+        return max(-self.tokens, 0) / self.rate
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
@@ -2,27 +2,65 @@
 
 import asyncio
 import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from datetime import datetime, timedelta
+from enum import Enum, auto
 from inspect import signature
-from typing import Any, Awaitable, Callable, Optional, Type, Union
+from time import perf_counter
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 from uuid import uuid4
 
-from proton import Delivery, Message
+from proton import Delivery, Endpoint, Link, Message, Session
 from proton.reactor import (
+    ApplicationEvent,
     Container,
     EventBase,
+    EventInjector,
+    LinkOption,
     Task,
 )
 
 from qpid_bow import Connector, ReconnectStrategy, RunState
+from qpid_bow.compression import decompress_message
+from qpid_bow.dedupe import Window
 from qpid_bow.exc import (
     QMF2Exception,
     RetriableMessage,
     TimeoutReached,
 )
+from qpid_bow.message import LazyMessage, decode_message, unpack_batch
+from qpid_bow.metrics import Metrics
+from qpid_bow.retry import RetryPolicy
 
 logger = logging.getLogger()
 
+# Credit issued on receiver links by default, equal to proton's default
+DEFAULT_PREFETCH = 10
+
+# Metric outcomes by delivery state
+SETTLED_OUTCOMES = {
+    Delivery.ACCEPTED: 'accepted',
+    Delivery.REJECTED: 'rejected',
+    Delivery.RELEASED: 'released',
+    Delivery.MODIFIED: 'released',
+}
+
 
 ReceiveCallback = Union[
     Callable[[Message], bool],
@@ -32,6 +70,57 @@ ReceiveCallback = Union[
 ]
 
 
+class AdaptivePrefetch:
+    """Sizes the credit window of receiver links by measured callback
+    latency.
+
+    The window holds about target_buffer worth of messages at the average
+    callback latency, so slow callbacks don't hoard messages other receivers
+    could process, while fast callbacks get enough credit to never wait for
+    the broker. Share an instance between addresses to size their windows
+    by their combined latency.
+
+    Args:
+        min_credit: Minimum credit window.
+        max_credit: Maximum credit window.
+        target_buffer: Duration of processing to keep buffered.
+        smoothing: Weight of each new latency measurement in the average.
+    """
+    def __init__(self, min_credit: int = 1, max_credit: int = 1000,
+                 target_buffer: timedelta = timedelta(milliseconds=100),
+                 smoothing: float = 0.1) -> None:
+        self.min_credit = min_credit
+        self.max_credit = max_credit
+        self.target_buffer = target_buffer.total_seconds()
+        self.smoothing = smoothing
+        self.latency: Optional[float] = None
+
+    def record(self, latency: float):
+        """Record the latency of a callback call.
+
+        Args:
+            latency: Seconds the callback took.
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+
+    @property
+    def window(self) -> int:
+        """Credit window for the measured latency."""
+        if not self.latency:
+            return self.min_credit
+
+        return max(self.min_credit,
+                   min(self.max_credit,
+                       int(self.target_buffer / self.latency)))
+
+
+Prefetch = Union[int, AdaptivePrefetch]
+CallbackFuture = Union[asyncio.Future, Future]
+
+
 class Receiver(Connector):
     """Callback based AMQP message receiver.
 
@@ -44,6 +133,43 @@ class Receiver(Connector):
         limit: Limit the amount of messages to receive.
         container_class: Qpid Proton reactor container-class to use.
         reconnect_strategy: Strategy to use on connection drop.
+        prefetch: Credit window of each address, the maximum amount of
+            messages the broker sends ahead of being settled. Either fixed or
+            an :obj:`AdaptivePrefetch`.
+        max_concurrency: Maximum amount of callbacks to run concurrently,
+            either async callbacks when running on an event loop, like with
+            the AsyncioContainer or when started from a running loop, or
+            callbacks run by the executor. Each message is settled once its
+            callback completes. Without it, concurrency is bounded by the
+            credit window.
+        executor: Run the callback in this thread or process pool instead of
+            in the reactor. Requires a callback taking only the message, and
+            one that can be pickled for a process pool.
+        ordered: Settle messages of concurrently run callbacks in the order
+            they were received, instead of as soon as their callback
+            completes.
+        metrics: Collect metrics of received messages.
+        lazy_body: Decode the header, properties and annotations of received
+            messages right away, but their body only when the callback
+            accesses it, see :obj:`qpid_bow.message.LazyMessage`.
+        dedupe_window: Accept messages with an ID already processed within
+            this window, like redeliveries after failover, without calling
+            the callback.
+        retry_policy: Hold messages whose callback raised RetriableMessage
+            for a backoff delay before releasing them to be retried, instead
+            of releasing them right away and rejecting them on their second
+            failure.
+        sessions: Amount of sessions to spread the links of the addresses
+            over, for receiving from many addresses.
+        lane_key: Function getting the key of a message, like its
+            correlation ID or a property. Messages are hashed by key into
+            ordered lanes, processing messages with the same key one by one
+            in the order they were received, while lanes run concurrently.
+            Requires concurrently run callbacks. Messages whose lane key
+            can't be got are rejected. A message released to be retried
+            loses its place in its lane, it is processed again after the
+            messages of the lane received before its redelivery.
+        lanes: Amount of lanes when using lane_key.
     """
     def __init__(
             self, callback: ReceiveCallback,
@@ -51,22 +177,84 @@ class Receiver(Connector):
             server_url: Optional[str] = None,
             limit: Optional[int] = None,
             container_class: Type[Any] = Container,
-            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.backoff
+            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.backoff,
+            prefetch: Prefetch = DEFAULT_PREFETCH,
+            max_concurrency: Optional[int] = None,
+            executor: Optional[Executor] = None,
+            ordered: bool = False,
+            metrics: Optional[Metrics] = None,
+            lazy_body: bool = False,
+            dedupe_window: Optional[Window] = None,
+            retry_policy: Optional[RetryPolicy] = None,
+            sessions: int = 1,
+            lane_key: Optional[Callable[[Message], Hashable]] = None,
+            lanes: int = 16
     ) -> None:
+        # Credit is issued by the Receiver itself
         super().__init__(server_url=server_url,
                          container_class=container_class,
-                         reconnect_strategy=reconnect_strategy)
+                         reconnect_strategy=reconnect_strategy,
+                         prefetch=0)
         self.limit = limit
         self.received = 0
         self.timeout: Optional[timedelta] = None
         self.timeout_task: Task = None
         self.receivers: dict = {}
         self.connection = None
+        self.prefetch = prefetch
+        self.address_prefetch: Dict[str, Prefetch] = {}
+        self.address_options: Dict[str, Sequence[LinkOption]] = {}
+        self.link_addresses: Dict[Link, str] = {}
+        self.session_count = sessions
+        self.link_sessions: List[Session] = []
+        self.next_session = 0
 
         self.callback = callback
         self.advanced_callback = len(signature(callback).parameters) == 2
+        self.async_callback = asyncio.iscoroutinefunction(callback)
+        if executor and (self.advanced_callback or self.async_callback):
+            raise ValueError("A Receiver with an executor requires a "
+                             "synchronous callback taking only the message")
+        if lane_key and not (executor or self.async_callback):
+            raise ValueError("A Receiver with lanes requires an executor or "
+                             "an async callback")
+        if lanes < 1:
+            raise ValueError("A Receiver requires at least one lane")
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Run callbacks as tasks on the loop of the container or executor
+        self.concurrent = False
+        self.max_concurrency = max_concurrency
+        self.executor = executor
+        self.ordered = ordered
+        # Wakes up a blocking container on completion of executor tasks
+        self.injector: Optional[EventInjector] = None
+        self.tasks: Set[CallbackFuture] = set()
+        # Running tasks in the order their messages were received
+        self.task_order: Deque[
+            Tuple[CallbackFuture, Link, Delivery, Message, float]] = deque()
+        # Messages waiting for a task slot
+        self.waiting: Deque[
+            Tuple[Link, Delivery, Message, Optional[int]]] = deque()
+        self.lane_key = lane_key
+        # Messages per lane, the first one being processed
+        self.lanes: List[Deque[Tuple[Link, Delivery, Message]]] = [
+            deque() for _ in range(lanes)]
+        self.task_lanes: Dict[CallbackFuture, int] = {}
+        # Messages taken from each link but not settled yet
+        self.in_flight: Dict[Link, int] = {}
+        self.metrics = metrics
+        self.lazy_body = lazy_body
+        self.dedupe_window = dedupe_window
+        self.retry_policy = retry_policy
+        # Timers releasing held messages to be retried
+        self.retry_tasks: Dict[Delivery, Task] = {}
+        self.draining = False
+        self.drain_task: Task = None
+        # Prefetched messages received while draining, released in bulk
+        self.drained_deliveries: List[Delivery] = []
         self.timeout_reached = False
-        self.start_time: Optional[datetime]
+        self.start_time: Optional[datetime] = None
 
         if address:
             self.receivers[address] = None
@@ -86,15 +274,49 @@ class Receiver(Connector):
         if self.timeout_reached:
             raise TimeoutReached()
 
-    def add_address(self, address: str):
+    def add_address(self, address: str, prefetch: Optional[Prefetch] = None,
+                    options: Optional[Sequence[LinkOption]] = None):
         """Start receiving messages from the given additional address.
 
         Args:
             address: Queue or exchange address to receive from.
+            prefetch: Credit window of this address, instead of the one of
+                the Receiver.
+            options: Link options for receiving from this address, like
+                broker-side filters created by
+                :func:`qpid_bow.filters.link_filter`.
         """
+        self._add_address(address, prefetch, options)
+        self.touch()
+
+    def add_addresses(self, addresses: Iterable[str],
+                      prefetch: Optional[Prefetch] = None,
+                      options: Optional[Sequence[LinkOption]] = None):
+        """Start receiving messages from the given additional addresses.
+
+        The links of all addresses are created before the container is
+        touched to attach them.
+
+        Args:
+            addresses: Queue or exchange addresses to receive from.
+            prefetch: Credit window of each of these addresses, instead of
+                the one of the Receiver.
+            options: Link options for receiving from each of these addresses.
+        """
+        for address in addresses:
+            self._add_address(address, prefetch, options)
+        self.touch()
+
+    def _add_address(self, address: str, prefetch: Optional[Prefetch],
+                     options: Optional[Sequence[LinkOption]]):
         if address in self.receivers:
             return
 
+        if prefetch is not None:
+            self.address_prefetch[address] = prefetch
+        if options:
+            self.address_options[address] = options
+
         if self.connection:
             self._start_receiver(address)
         else:
@@ -106,38 +328,213 @@ class Receiver(Connector):
         Args:
             address: Queue or exchange address to stop receiving from.
         """
+        self._remove_address(address)
+        self.touch()
+
+    def remove_addresses(self, addresses: Iterable[str]):
+        """Stop receiving messages from the given addresses.
+
+        Args:
+            addresses: Queue or exchange addresses to stop receiving from.
+        """
+        for address in addresses:
+            self._remove_address(address)
+        self.touch()
+
+    def _remove_address(self, address: str):
         receiver = self.receivers.pop(address)
-        receiver.close()
+        self.address_prefetch.pop(address, None)
+        self.address_options.pop(address, None)
+        if receiver:  # Not started before connecting
+            self.link_addresses.pop(receiver, None)
+            receiver.close()
 
     def _start_receiver(self, address: str):
+        """Create the link of an address, left to be attached by the
+        container on its next processing.
+
+        The link is created on the session itself rather than by the
+        container, which may process each link it creates, like the
+        AsyncioContainer does.
+        """
+        session = self._next_session()
         if address == '#':  # AMQP-dynamic queue address
-            receiver = self.container.create_receiver(self.connection,
-                                                      dynamic=True)
+            receiver = session.receiver(
+                f'{self.connection.container}-{uuid4()}')
+            receiver.source.dynamic = True
         else:
-            receiver = self.container.create_receiver(
-                self.connection,
-                address,
-                # Add UUID to name to prevent add/remove link race condition
-                name=f'{self.connection.container}-{address}-{uuid4()}')
+            # Add UUID to name to prevent add/remove link race condition
+            receiver = session.receiver(
+                f'{self.connection.container}-{address}-{uuid4()}')
+            receiver.source.address = address
+        for option in self.address_options.get(address, ()):
+            if option.test(receiver):
+                option.apply(receiver)
+        receiver.open()
+
         self.receivers[address] = receiver
+        self.link_addresses[receiver] = address
+        receiver.flow(self._credit_window(address))
+
+    def _next_session(self) -> Session:
+        """Get the session to create the next link on, round robin over
+        the sessions of the Receiver."""
+        if len(self.link_sessions) < self.session_count:
+            session = self.connection.session()
+            session.open()
+            self.link_sessions.append(session)
+            return session
+
+        session = self.link_sessions[self.next_session]
+        self.next_session = (self.next_session + 1) % self.session_count
+        return session
+
+    def _close_sessions(self):
+        """Close the sessions of the Receiver, along with their links."""
+        for session in self.link_sessions:
+            session.close()
+        self.link_sessions.clear()
+        self.next_session = 0
+
+    def _credit_window(self, address: str) -> int:
+        prefetch = self.address_prefetch.get(address, self.prefetch)
+        if isinstance(prefetch, AdaptivePrefetch):
+            return prefetch.window
+        return prefetch
+
+    def _link_address(self, link: Link) -> str:
+        address = self.link_addresses.get(link)
+        if address is None:
+            return link.source.address
+        return address
+
+    def _callback_done(self, receiver: Link, latency: float):
+        """Record the latency of a callback and issue credit to refill the
+        window of its receiver link, once half of it has been used, counting
+        messages waiting to be processed."""
+        address = self.link_addresses.get(receiver)
+        if address is None:
+            return
+
+        if self.metrics:
+            self.metrics.observe('callback_seconds', address, latency)
+
+        prefetch = self.address_prefetch.get(address, self.prefetch)
+        if isinstance(prefetch, AdaptivePrefetch):
+            prefetch.record(latency)
+
+        self._refill_credit(receiver, address)
+
+    def _refill_credit(self, receiver: Link, address: str):
+        if self.draining:
+            return
+
+        window = self._credit_window(address)
+        outstanding = (receiver.credit + receiver.queued +
+                       self.in_flight.get(receiver, 0))
+        if outstanding <= window // 2:
+            receiver.flow(window - outstanding)
 
     def _restart_receivers(self):
+        """Attach the links of all addresses in a single pass, on fresh
+        sessions replacing those of before a reconnect, touching the
+        container once."""
         addresses = list(self.receivers.keys())
+        self._close_sessions()
         self.receivers.clear()
-        logger.debug("Starting receivers for addresses %s", addresses)
+        self.link_addresses.clear()
+        self.in_flight.clear()
+        logger.debug("Starting receivers for %d addresses", len(addresses))
         for address in addresses:
             self._start_receiver(address)
+        self.touch()
+
+    def drain(self, timeout: timedelta = timedelta(seconds=30)):
+        """Stop gracefully, letting running callbacks complete.
+
+        Stops issuing credit and releases messages waiting to be processed.
+        Once the running callbacks completed, or when the timeout is
+        reached, prefetched messages are released in bulk and the Receiver
+        is stopped. Let the container process until the Receiver stopped,
+        like with :obj:`process_until`, for the drain to complete.
+
+        Args:
+            timeout: Maximum duration to wait for running callbacks.
+        """
+        if self.draining:
+            return
+        if not self.start_time:
+            self.stop()
+            return
+
+        logger.debug("Draining %s", self)
+        self.draining = True
+        self.drain_task = self.schedule(timeout.total_seconds(),
+                                        self._finish_drain)
+
+        # Messages not being processed yet are released right away
+        for _, delivery, _, _ in self.waiting:
+            self.release(delivery)
+        self.waiting.clear()
+        for lane in self.lanes:
+            # The first message of a lane is running or was waiting
+            while len(lane) > 1:
+                self.release(lane.pop()[1])
+        for delivery, task in list(self.retry_tasks.items()):
+            task.cancel()
+            self._release_held(delivery)
+
+        if not self.tasks:
+            self._finish_drain()
+        self.touch()
+
+    def _finish_drain(self):
+        if not self.draining:
+            return
+
+        logger.debug("Drained %s, releasing %d prefetched messages", self,
+                     len(self.drained_deliveries))
+        for delivery in self.drained_deliveries:
+            self.release(delivery)
+        self.drained_deliveries.clear()
+        self.stop()
 
     def stop(self):
         if self.timeout_task:
             self.timeout_task.cancel()
             self.timeout_task = None
+        if self.drain_task:
+            self.drain_task.cancel()
+            self.drain_task = None
+        self.draining = False
+        self.drained_deliveries.clear()
 
         self.received = 0
         self.start_time = None
-        for address in self.receivers:
-            self.receivers[address].close()
+        for address, receiver in self.receivers.items():
+            if receiver:  # Not started before connecting
+                receiver.close()
             self.receivers[address] = None
+        self.link_addresses.clear()
+        self._close_sessions()
+        # Unsettled messages get released by closing their link
+        self.waiting.clear()
+        for lane in self.lanes:
+            lane.clear()
+        self.task_lanes.clear()
+        for task in self.retry_tasks.values():
+            task.cancel()
+        self.retry_tasks.clear()
+        # Executor tasks can only be cancelled before they start running,
+        # either way their messages get released by closing their link
+        for task in list(self.tasks):
+            task.cancel()
+        self.tasks.clear()
+        self.task_order.clear()
+        self.in_flight.clear()
+        if self.injector:
+            self.injector.close()
+            self.injector = None
 
         super().stop()
 
@@ -170,66 +567,641 @@ class Receiver(Connector):
 
     def on_start(self, event):
         super().on_start(event)
-        if self.run_state == RunState.started:
+        # Touching an AsyncioContainer while handling the event, like on
+        # attaching the links, handles the event again
+        if self.run_state == RunState.started and self.start_time is None:
+            container_loop = getattr(event.container, 'loop', None)
+            self.loop = container_loop
+            if self.async_callback and not self.loop:
+                self.loop = asyncio.get_event_loop()
+            # A running loop can't run a callback until complete, so its
+            # callbacks run as tasks, like on the loop of the container
+            self.concurrent = bool(self.executor or (
+                self.async_callback and (container_loop or
+                                         self.loop.is_running())))
+            if self.executor and not self.loop:
+                self.injector = EventInjector()
+                event.container.selectable(self.injector)
             self.start_time = datetime.utcnow()
             if self.timeout:
                 self.timeout_task = event.container.schedule(0.25, self)
             self._restart_receivers()
 
+    def settle(self, delivery: Delivery, state=None):
+        if self.metrics:
+            self.metrics.increment('settled_total',
+                                   self._link_address(delivery.link),
+                                   SETTLED_OUTCOMES.get(state, 'settled'))
+        super().settle(delivery, state)
+
+    def on_delivery(self, event):
+        """Handles delivery event, receiving messages with a lazily decoded
+        body when enabled.
+
+        Other deliveries are left to the IncomingMessageHandler of the
+        MessagingHandler, which handles the event after this handler. A
+        delivery received here is no longer readable for it.
+
+        Args:
+            event: Delivery event.
+        """
+        delivery = event.delivery
+        if not (self.lazy_body and delivery.link.is_receiver and
+                delivery.readable and not delivery.partial):
+            return
+
+        link = delivery.link
+        event.message = LazyMessage(link.recv(delivery.pending))
+        link.advance()
+        if not link.state & Endpoint.LOCAL_CLOSED:
+            self.on_message(event)
+
     def on_message(self, event):
         if not self.start_time:
             # Eagerly got more messages then we're interested in, release
             self.release(event.delivery)
             return
 
+        if self.draining:
+            self.drained_deliveries.append(event.delivery)
+            return
+
+        if self.metrics:
+            self.metrics.increment('received_total',
+                                   self._link_address(event.receiver))
+
+        if self._is_duplicate(event.message):
+            address = self._link_address(event.receiver)
+            if self.metrics:
+                self.metrics.increment('duplicates_total', address)
+            self.accept(event.delivery)
+            self._refill_credit(event.receiver, address)
+            return
+
+        if self.concurrent:
+            self._dispatch_task(event.receiver, event.delivery, event.message)
+            return
+
+        message, delivery = event.message, event.delivery
+        callback_start = perf_counter()
         try:
-            if asyncio.iscoroutinefunction(self.callback):
-                loop = asyncio.get_event_loop()
-                if not loop.is_running():
-                    success = loop.run_until_complete(
-                        self.handle_async_message(event))
-                else:
-                    success = asyncio.ensure_future(
-                        self.handle_async_message(event), loop=loop)
+            if self.async_callback:
+                self._settle(message, delivery,
+                             lambda: self.loop.run_until_complete(
+                                 self._handle_async_message(message, delivery)))
             else:
-                success = self.handle_message(event)
+                self._settle(message, delivery,
+                             lambda: self._handle_message(message, delivery))
+        finally:
+            self._callback_done(event.receiver,
+                                perf_counter() - callback_start)
+            self.touch()
+            self.received += 1
+            if self.received == self.limit:
+                self.stop()
 
-            if success:
-                self.accept(event.delivery)
+    def _settle(self, message: Message, delivery: Delivery,
+                get_result: Callable[[], Any]):
+        """Settle a message by the result of its callback."""
+        try:
+            if get_result():
+                self.accept(delivery)
+                if self.dedupe_window is not None and message.id is not None:
+                    self.dedupe_window.seen(message.id)
             else:
-                self.reject(event.delivery)
+                self.reject(delivery)
         except RetriableMessage:
-            if event.message.delivery_count:
-                self.reject(event.delivery)
-            else:
-                # Set the delivery status before releasing back into the queue
-                # https://bugzilla.redhat.com/show_bug.cgi?id=1283652
-                event.delivery.local.undeliverable = True
-                event.delivery.local.failed = True
-                self.release(event.delivery)
+            self.retry(message, delivery)
         except QMF2Exception:
-            self.accept(event.delivery)
+            self.accept(delivery)
             raise
         except Exception:
             # On unexpected error, we will reject the message and re-raise
             logger.error('Unexpected error, rejecting the message',
                          exc_info=True)
-            self.reject(event.delivery)
+            self.reject(delivery)
             raise
+
+    def _is_duplicate(self, message: Message) -> bool:
+        if (self.dedupe_window is None or message.id is None or
+                message.id not in self.dedupe_window):
+            return False
+
+        logger.debug("Accepting duplicate message %s", message.id)
+        return True
+
+    def _dispatch_task(self, receiver: Link, delivery: Delivery,
+                       message: Message):
+        if self.limit and self.received >= self.limit:
+            # Waiting for the last callbacks before stopping
+            self.release(delivery)
+            return
+
+        lane_index = None
+        if self.lane_key is not None:
+            try:
+                lane_index = hash(self.lane_key(message)) % len(self.lanes)
+            except Exception:  # pylint: disable=broad-except
+                logger.error('Unexpected error getting the lane key, '
+                             'rejecting the message', exc_info=True)
+                self.reject(delivery)
+                self._refill_credit(receiver, self._link_address(receiver))
+                return
+
+        self.received += 1
+        self._set_in_flight(receiver, self.in_flight.get(receiver, 0) + 1)
+        if lane_index is not None:
+            lane = self.lanes[lane_index]
+            lane.append((receiver, delivery, message))
+            if len(lane) > 1:
+                # Waiting for the previous messages of the lane
+                return
+
+        self._start_or_wait(receiver, delivery, message, lane_index)
+
+    def _start_or_wait(self, receiver: Link, delivery: Delivery,
+                       message: Message, lane_index: Optional[int]):
+        if self.max_concurrency and len(self.tasks) >= self.max_concurrency:
+            self.waiting.append((receiver, delivery, message, lane_index))
+            return
+
+        self._start_task(receiver, delivery, message, lane_index)
+
+    def _start_task(self, receiver: Link, delivery: Delivery,
+                    message: Message, lane_index: Optional[int] = None):
+        callback_start = perf_counter()
+        task: CallbackFuture
+        if self.executor is None:
+            task = asyncio.ensure_future(
+                self._handle_async_message(message, delivery), loop=self.loop)
+        elif isinstance(self.executor, ProcessPoolExecutor):
+            task = self.executor.submit(handle_encoded_message,
+                                        self.callback, message.encode())
+        else:
+            task = self.executor.submit(self._handle_message, message,
+                                        delivery)
+
+        self.tasks.add(task)
+        if lane_index is not None:
+            self.task_lanes[task] = lane_index
+        if self.ordered:
+            self.task_order.append(
+                (task, receiver, delivery, message, callback_start))
+
+        def on_done(done: CallbackFuture):
+            self._on_task_done(done, receiver, delivery, message,
+                               callback_start)
+
+        if self.executor is None:
+            task.add_done_callback(on_done)
+        else:
+            task.add_done_callback(
+                lambda done: self._call_in_reactor(lambda: on_done(done)))
+
+    def _call_in_reactor(self, function: Callable[[], None]):
+        """Call a function from the reactor, called from another thread."""
+        if self.loop:
+            self.loop.call_soon_threadsafe(function)
+            return
+
+        injector = self.injector
+        if injector is not None:
+            injector.trigger(ApplicationEvent('task_done', subject=function))
+
+    def on_task_done(self, event: EventBase):
+        """Handles the completion of a task run by the executor.
+
+        Args:
+            event: Application event with the function to call as subject.
+        """
+        event.subject()
+
+    def _on_task_done(self, task: CallbackFuture, receiver: Link,
+                      delivery: Delivery, message: Message,
+                      callback_start: float):
+        if not self.ordered:
+            self._complete_task(task, receiver, delivery, message,
+                                callback_start)
+            return
+
+        while self.task_order and self.task_order[0][0].done():
+            self._complete_task(*self.task_order.popleft())
+
+    def _complete_task(self, task: CallbackFuture, receiver: Link,
+                       delivery: Delivery, message: Message,
+                       callback_start: float):
+        self.tasks.discard(task)
+        lane_index = self.task_lanes.pop(task, None)
+        if receiver not in self.in_flight:
+            # Stopped in the meantime, the message got released
+            return
+
+        self._set_in_flight(receiver, self.in_flight[receiver] - 1)
+        try:
+            if task.cancelled():
+                self.release(delivery)
+            else:
+                self._settle(message, delivery, task.result)
+        except QMF2Exception:
+            logger.error('QMF2 error in callback', exc_info=True)
+        except Exception:  # pylint: disable=broad-except
+            # Already logged on rejecting, there is no caller to raise to
+            pass
         finally:
-            self.touch()
-            self.received += 1
-            if self.received == self.limit:
+            self._callback_done(receiver, perf_counter() - callback_start)
+            if lane_index is not None:
+                lane = self.lanes[lane_index]
+                lane.popleft()
+                if lane:
+                    self._start_or_wait(*lane[0], lane_index)
+            while self.waiting and len(self.tasks) < self.max_concurrency:
+                self._start_task(*self.waiting.popleft())
+            if self.draining and not self.tasks:
+                self._finish_drain()
+            elif (self.received == self.limit and not self.tasks and
+                    not self.waiting):
                 self.stop()
+            self.touch()
+
+    def _set_in_flight(self, receiver: Link, count: int):
+        self.in_flight[receiver] = count
+        if self.metrics:
+            self.metrics.set('in_flight', self._link_address(receiver), count)
+
+    def retry(self, message: Message, delivery: Delivery):
+        """Release a message back into the queue to be retried, or reject it
+        when it was delivered before.
+
+        With a retry policy, the message is held for the delay of the policy
+        before releasing it, and rejected once it is out of attempts. Held
+        messages count towards the credit window of their link.
+
+        Args:
+            message: Received message.
+            delivery: Delivery of the message.
+        """
+        if self.retry_policy is None:
+            if message.delivery_count:
+                self.reject(delivery)
+            else:
+                self._release_failed(delivery)
+            return
+
+        # The broker counts failed deliveries of the message
+        delay = self.retry_policy.delay(message.delivery_count + 1)
+        if delay is None:
+            self.reject(delivery)
+            return
+
+        link = delivery.link
+        self._set_in_flight(link, self.in_flight.get(link, 0) + 1)
+        self.retry_tasks[delivery] = self.schedule(
+            delay, lambda: self._release_held(delivery))
+
+    def _release_held(self, delivery: Delivery):
+        if self.retry_tasks.pop(delivery, None) is None:
+            # Stopped in the meantime, the message got released
+            return
+
+        link = delivery.link
+        self._set_in_flight(link, self.in_flight[link] - 1)
+        self._release_failed(delivery)
+        address = self.link_addresses.get(link)
+        if address is not None:
+            self._refill_credit(link, address)
+
+    def _release_failed(self, delivery: Delivery):
+        # Set the delivery status before releasing back into the queue
+        # https://bugzilla.redhat.com/show_bug.cgi?id=1283652
+        delivery.local.undeliverable = True
+        delivery.local.failed = True
+        self.release(delivery)
+
+    @staticmethod
+    def unpack_message(message: Message) -> List[Message]:
+        """Decompress a received message and unpack it when it is a batch
+        envelope.
+
+        Args:
+            message: Received message.
+
+        Returns:
+            List[Message]: Logical messages to pass to the callback.
+        """
+        return [decompress_message(unpacked) for unpacked
+                in unpack_batch(decompress_message(message))]
 
     def handle_message(self, event):
-        if self.advanced_callback:
-            return self.callback(event.message, event.delivery)
+        """Call the callback for the received message.
 
-        return self.callback(event.message)
+        Args:
+            event: Message event.
+
+        Returns:
+            bool: Result of the callback.
+        """
+        return self._handle_message(event.message, event.delivery)
 
     async def handle_async_message(self, event):
-        if self.advanced_callback:
-            return await self.callback(event.message, event.delivery)
+        """Await the async callback for the received message.
+
+        Args:
+            event: Message event.
+
+        Returns:
+            bool: Result of the callback.
+        """
+        return await self._handle_async_message(event.message, event.delivery)
+
+    def _handle_message(self, message: Message, delivery: Delivery):
+        """Call the callback for each message of the delivery, which are
+        multiple for a batch envelope. Stops at the first message not handled
+        successfully, as the delivery is settled as a whole."""
+        for unpacked in self.unpack_message(message):
+            if self.advanced_callback:
+                success = self.callback(unpacked, delivery)
+            else:
+                success = self.callback(unpacked)
+            if not success:
+                return success
+
+        return True
+
+    async def _handle_async_message(self, message: Message,
+                                    delivery: Delivery):
+        for unpacked in self.unpack_message(message):
+            if self.advanced_callback:
+                success = await self.callback(unpacked, delivery)
+            else:
+                success = await self.callback(unpacked)
+            if not success:
+                return success
+
+        return True
+
+
+def handle_encoded_message(callback: Callable[[Message], bool],
+                           data: bytes) -> bool:
+    """Decode a received message and call the callback for each of its
+    logical messages, for running the callback in another process.
+
+    Args:
+        callback: Function to call with each message.
+        data: Raw AMQP data of the received message.
+
+    Returns:
+        bool: True when all messages were handled successfully.
+    """
+    for message in Receiver.unpack_message(decode_message(data)):
+        if not callback(message):
+            return False
+
+    return True
+
+
+class Settlement(Enum):
+    """How to settle a received message."""
+    accept = auto()
+    reject = auto()
+    release = auto()
+
+
+# Settlements in increasing order of precedence when combined for a delivery
+SETTLEMENT_PRECEDENCE = (Settlement.accept, Settlement.release,
+                         Settlement.reject)
+
+BatchResult = Union[bool, Sequence[Union[bool, Settlement]]]
+BatchReceiveCallback = Union[
+    Callable[[List[Message]], BatchResult],
+    Callable[[List[Message]], Awaitable[BatchResult]],
+]
+
+
+class BatchReceiver(Receiver):
+    """Callback based AMQP message receiver, passing messages in batches.
+
+    A batch is passed to the callback once it holds batch_size messages, or
+    once batch_timeout passed since its first message arrived. The callback
+    returns how to settle the messages: a single bool to accept or reject all
+    of them, or a sequence with a bool or :obj:`Settlement` per message.
+    Raising RetriableMessage releases the whole batch.
+
+    Messages of a batch envelope share their delivery, which is rejected when
+    any of them is rejected, otherwise released when any of them is released.
+
+    Args:
+        callback: Function to call with a list of received messages.
+        address: Name of queue or exchange from where to receive the messages.
+        server_url: Comma-separated list of urls to connect to.
+            Multiple can be specified for connection fallback, the first
+            should be the primary server.
+        limit: Limit the amount of messages to receive.
+        container_class: Qpid Proton reactor container-class to use.
+        reconnect_strategy: Strategy to use on connection drop.
+        prefetch: Credit window of each address, defaults to twice the batch
+            size. Messages of batches filling up or running count towards
+            the window, which bounds the amount of concurrently run async
+            batches.
+        batch_size: Maximum amount of messages to pass at once.
+        batch_timeout: Maximum duration to wait for a batch to fill up.
+        metrics: Collect metrics of received messages.
+    """
+    def __init__(
+            self, callback: BatchReceiveCallback,
+            address: Optional[str] = None,
+            server_url: Optional[str] = None,
+            limit: Optional[int] = None,
+            container_class: Type[Any] = Container,
+            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.backoff,
+            prefetch: Optional[Prefetch] = None,
+            batch_size: int = 100,
+            batch_timeout: timedelta = timedelta(milliseconds=100),
+            metrics: Optional[Metrics] = None
+    ) -> None:
+        super().__init__(callback, address, server_url, limit,  # type: ignore
+                         container_class, reconnect_strategy,
+                         batch_size * 2 if prefetch is None else prefetch,
+                         metrics=metrics)
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.flush_task: Task = None
+
+        self.batch: List[Message] = []
+        # Delivery of each message in the batch
+        self.batch_message_deliveries: List[Delivery] = []
+        # Received message of each delivery in the batch
+        self.batch_deliveries: Dict[Delivery, Message] = OrderedDict()
+
+    def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+
+        # Running batches would get cancelled right away
+        if self.batch and self.start_time and not self.concurrent:
+            self.flush()
+
+        super().stop()
+
+    def drain(self, timeout: timedelta = timedelta(seconds=30)):
+        # The batch filling up is passed to the callback right away, for the
+        # drain to wait for it like for other running callbacks
+        if not self.draining and self.start_time:
+            self.flush()
+        super().drain(timeout)
+
+    def on_message(self, event):
+        if not self.start_time or (self.limit and
+                                   self.received >= self.limit):
+            # Eagerly got more messages then we're interested in, release
+            self.release(event.delivery)
+            return
+
+        if self.draining:
+            self.drained_deliveries.append(event.delivery)
+            return
+
+        if self.metrics:
+            self.metrics.increment('received_total',
+                                   self._link_address(event.receiver))
+
+        # Messages count towards the credit window until settled, also
+        # while their batch fills up or runs
+        self._set_in_flight(event.receiver,
+                            self.in_flight.get(event.receiver, 0) + 1)
+        self.batch_deliveries[event.delivery] = event.message
+        for message in self.unpack_message(event.message):
+            self.batch.append(message)
+            self.batch_message_deliveries.append(event.delivery)
+
+        self.received += 1
+        if self.received == self.limit:
+            self.flush()
+            if not self.tasks:
+                self.stop()
+        elif len(self.batch) >= self.batch_size:
+            self.flush()
+        elif not self.flush_task:
+            self.flush_task = self.schedule(
+                self.batch_timeout.total_seconds(), self.flush)
+
+    def flush(self):
+        """Pass the messages received so far to the callback and settle
+        them."""
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+
+        if not self.batch:
+            return
+
+        messages = self.batch
+        deliveries = self.batch_message_deliveries
+        received = self.batch_deliveries
+        self.batch = []
+        self.batch_message_deliveries = []
+        self.batch_deliveries = OrderedDict()
+
+        callback_start = perf_counter()
+        if not self.async_callback:
+            self._settle_batch(received, deliveries,
+                               lambda: self.callback(messages),
+                               callback_start)
+            return
+
+        if not self.concurrent:
+            self._settle_batch(
+                received, deliveries,
+                lambda: self.loop.run_until_complete(self.callback(messages)),
+                callback_start)
+            return
+
+        future = asyncio.ensure_future(self.callback(messages),
+                                       loop=self.loop)
+        self.tasks.add(future)
+        future.add_done_callback(
+            lambda done: self._on_batch_done(done, received, deliveries,
+                                             callback_start))
+
+    def _on_batch_done(self, future: asyncio.Future,
+                       received: Dict[Delivery, Message],
+                       deliveries: List[Delivery], callback_start: float):
+        self.tasks.discard(future)
+        try:
+            if future.cancelled():
+                self._batch_settled(received)
+                for delivery in received:
+                    self.release(delivery)
+            else:
+                self._settle_batch(received, deliveries, future.result,
+                                   callback_start)
+        except QMF2Exception:
+            logger.error('QMF2 error in callback', exc_info=True)
+        except Exception:  # pylint: disable=broad-except
+            # Already logged on rejecting, there is no caller to raise to
+            pass
+        finally:
+            if self.draining and not self.tasks:
+                self._finish_drain()
+            elif self.received == self.limit and not self.tasks:
+                self.stop()
+            self.touch()
+
+    def _settle_batch(self, received: Dict[Delivery, Message],
+                      deliveries: List[Delivery],
+                      get_result: Callable[[], BatchResult],
+                      callback_start: float):
+        try:
+            settlements = self._delivery_settlements(deliveries, get_result())
+        except RetriableMessage:
+            for delivery, message in received.items():
+                self.retry(message, delivery)
+            return
+        except Exception:
+            # On unexpected error, we will reject the batch and re-raise
+            logger.error('Unexpected error, rejecting the batch',
+                         exc_info=True)
+            for delivery in received:
+                self.reject(delivery)
+            raise
+        else:
+            for delivery, settlement in settlements.items():
+                if settlement == Settlement.accept:
+                    self.accept(delivery)
+                elif settlement == Settlement.release:
+                    self.release(delivery)
+                else:
+                    self.reject(delivery)
+        finally:
+            self._batch_settled(received)
+            latency = (perf_counter() - callback_start) / len(deliveries)
+            for link in {delivery.link for delivery in received}:
+                self._callback_done(link, latency)
+            self.touch()
+
+    def _batch_settled(self, received: Dict[Delivery, Message]):
+        for delivery in received:
+            link = delivery.link
+            if link in self.in_flight:  # Not stopped in the meantime
+                self._set_in_flight(link, self.in_flight[link] - 1)
+
+    @staticmethod
+    def _delivery_settlements(
+            deliveries: List[Delivery],
+            result: BatchResult) -> Dict[Delivery, Settlement]:
+        if not isinstance(result, Sequence):
+            result = [bool(result)] * len(deliveries)
+        elif len(result) != len(deliveries):
+            raise ValueError(f"Batch callback returned {len(result)} "
+                             f"settlements for {len(deliveries)} messages")
+
+        settlements: Dict[Delivery, Settlement] = OrderedDict()
+        for delivery, message_result in zip(deliveries, result):
+            if not isinstance(message_result, Settlement):
+                message_result = (Settlement.accept if message_result
+                                  else Settlement.reject)
+            settlements[delivery] = max(
+                settlements.get(delivery, Settlement.accept), message_result,
+                key=SETTLEMENT_PRECEDENCE.index)
 
-        return await self.callback(event.message)
+        return settlements
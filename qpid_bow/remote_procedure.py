@@ -1,13 +1,20 @@
 """Remote procedure call handling."""
 
+import asyncio
+from collections import deque
+from concurrent.futures import Future
 from datetime import timedelta
 from logging import getLogger
-from typing import Optional
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple, Type
+from uuid import uuid4
 from warnings import warn
 
-from proton import Message
+from proton import Link, Message
+from proton.reactor import Container, Task
 
 from qpid_bow import ReconnectStrategy, RunState
+from qpid_bow.asyncio import Container as AsyncioContainer
+from qpid_bow.exc import TimeoutReached
 from qpid_bow.receiver import (
     Receiver,
     ReceiveCallback,
@@ -78,3 +85,238 @@ class RemoteProcedure(Receiver):
     def reply_to(self):
         """Reply to address of our temporary queue."""
         return self.receivers['#'].remote_source.address
+
+
+class RemoteProcedureClient(Receiver):
+    """Long-lived RPC client, sending many concurrent calls over a single
+    connection and receiving their replies on a single temporary queue.
+
+    Replies are matched to their call by correlation ID, so the correlation
+    ID of each call message is replaced by a unique one. A call completes on
+    its first reply without a 'partial' property. Open the client with
+    :obj:`open` and close it with :obj:`close` once done.
+
+    Replies to calls sent before a reconnect can't arrive anymore, as they
+    were sent to the temporary queue of the previous connection. These calls
+    fail with a ConnectionError, calls not sent yet are sent after the
+    reconnect.
+
+    Args:
+        address: Address of queue or exchange to send the call messages to.
+        server_url: Comma-separated list of urls to connect to.
+            Multiple can be specified for connection fallback, the first
+            should be the primary server.
+        container_class: Qpid Proton reactor container-class to use.
+        reconnect_strategy: Strategy to use on connection drop.
+    """
+    def __init__(
+            self, address: str, server_url: Optional[str] = None,
+            container_class: Type[Any] = Container,
+            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.failover
+    ) -> None:
+        super().__init__(self._handle_reply, '#', server_url,
+                         container_class=container_class,
+                         reconnect_strategy=reconnect_strategy)
+        self.send_address = address
+        self.sender: Optional[Link] = None
+        # Outstanding calls by correlation ID, with replies so far
+        self.calls: Dict[str, Tuple[Future, List[Message], Task]] = {}
+        # Call messages waiting for the links to be ready
+        self.unsent: Deque[Message] = deque()
+        # Correlation IDs of outstanding calls that have been sent
+        self.sent: Set[str] = set()
+        # Links attached by the broker on the current connection, proton
+        # attaches them again after failing over
+        self.attached: Set[Link] = set()
+        self.is_open = False
+
+    def submit(self, message: Message,
+               timeout: timedelta = timedelta(seconds=30)) -> Future:
+        """Send a call message without waiting for its reply.
+
+        Args:
+            message: Message to send to the RPC address.
+            timeout: Maximum duration to wait for a reply.
+
+        Returns:
+            Future: Future resolving to the reply messages of the call, or
+            raising TimeoutReached when no reply arrived in time.
+
+        Raises:
+            RuntimeError: When the client is not open.
+        """
+        if not self.is_open or self.run_state == RunState.failed:
+            raise RuntimeError("RemoteProcedureClient is not open")
+
+        correlation_id = uuid4().hex
+        message.correlation_id = correlation_id
+        future: Future = Future()
+        timeout_task = self.schedule(
+            timeout.total_seconds(), lambda: self._expire(correlation_id))
+        self.calls[correlation_id] = (future, [], timeout_task)
+        future.add_done_callback(
+            lambda done: self._forget(correlation_id) if done.cancelled()
+            else None)
+        self.unsent.append(message)
+        self._send_calls()
+        self.touch()
+        return future
+
+    def call(self, message: Message,
+             timeout: timedelta = timedelta(seconds=30)) -> List[Message]:
+        """Send a call message and wait for its reply.
+
+        Args:
+            message: Message to send to the RPC address.
+            timeout: Maximum duration to wait for a reply.
+
+        Returns:
+            List[Message]: Reply messages of the call, more than one when
+            the replies are partial.
+        """
+        future = self.submit(message, timeout)
+        self.process_until(future.done)
+        return future.result()
+
+    def open(self):
+        super().open()
+        self.is_open = True
+
+    def close(self):
+        # Not stopped when closed before the container started processing
+        self._cancel_calls()
+        super().close()
+
+    @property
+    def reply_to(self) -> Optional[str]:
+        """Reply to address of our temporary queue."""
+        receiver = self.receivers.get('#')
+        if receiver not in self.attached:
+            return None
+        return receiver.remote_source.address
+
+    def _restart_receivers(self):
+        super()._restart_receivers()
+        if self.sender is None:
+            # Attached again by proton itself on reconnecting
+            self.sender = self.container.create_sender(self.connection,
+                                                       self.send_address)
+
+    def _send_calls(self):
+        reply_to = self.reply_to
+        if not (self.sender in self.attached and reply_to):
+            # Wait until the links have been set up
+            return
+
+        while self.unsent and self.sender.credit:
+            message = self.unsent.popleft()
+            if message.correlation_id not in self.calls:
+                # Expired before it could be sent
+                continue
+            message.reply_to = reply_to
+            self.sender.send(message)
+            self.sent.add(message.correlation_id)
+
+    def on_link_opened(self, event):
+        self.attached.add(event.link)
+        self._send_calls()
+
+    def on_sendable(self, event):
+        self._send_calls()
+
+    def _handle_reply(self, message: Message) -> bool:
+        call = self.calls.get(message.correlation_id)
+        if call is None:
+            logger.debug("Dropping reply to unknown call %s",
+                         message.correlation_id)
+            return True
+
+        future, replies, timeout_task = call
+        replies.append(message)
+        if 'partial' not in (message.properties or {}):
+            del self.calls[message.correlation_id]
+            self.sent.discard(message.correlation_id)
+            timeout_task.cancel()
+            future.set_result(replies)
+        return True
+
+    def _forget(self, correlation_id: str):
+        self.sent.discard(correlation_id)
+        call = self.calls.pop(correlation_id, None)
+        if call is not None:
+            call[2].cancel()
+
+    def _expire(self, correlation_id: str):
+        self.sent.discard(correlation_id)
+        call = self.calls.pop(correlation_id, None)
+        if call is not None:
+            call[0].set_exception(TimeoutReached())
+
+    def on_transport_error(self, event):
+        # Fail calls awaiting a reply on the temporary queue of the lost
+        # connection right away, instead of on their timeout
+        for correlation_id in self.sent:
+            call = self.calls.pop(correlation_id, None)
+            if call is not None:
+                call[2].cancel()
+                call[0].set_exception(ConnectionError(
+                    "Connection lost before the reply to the call arrived"))
+        self.sent.clear()
+        self.attached.clear()
+        super().on_transport_error(event)
+
+    def stop(self):
+        self._cancel_calls()
+        self.attached.clear()
+        self.sender = None
+        super().stop()
+
+    def _cancel_calls(self):
+        self.is_open = False
+        # Cancelling a future forgets its call, so clear the calls first
+        calls = list(self.calls.values())
+        self.calls.clear()
+        for future, _, timeout_task in calls:
+            timeout_task.cancel()
+            future.cancel()
+        self.unsent.clear()
+        self.sent.clear()
+
+
+class AsyncRemoteProcedureClient(RemoteProcedureClient):
+    """Long-lived RPC client with awaitable calls, running on the event loop
+    of the AsyncioContainer.
+
+    Args:
+        address: Address of queue or exchange to send the call messages to.
+        server_url: Comma-separated list of urls to connect to.
+            Multiple can be specified for connection fallback, the first
+            should be the primary server.
+        reconnect_strategy: Strategy to use on connection drop.
+    """
+    def __init__(
+            self, address: str, server_url: Optional[str] = None,
+            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.failover
+    ) -> None:
+        super().__init__(address, server_url,
+                         container_class=AsyncioContainer,
+                         reconnect_strategy=reconnect_strategy)
+
+    async def call(self, message: Message,  # type: ignore
+                   timeout: timedelta = timedelta(seconds=30)
+                   ) -> List[Message]:
+        """Send a call message and wait for its reply.
+
+        Cancelling the waiting task cancels the call, a reply arriving later
+        is dropped.
+
+        Args:
+            message: Message to send to the RPC address.
+            timeout: Maximum duration to wait for a reply.
+
+        Returns:
+            List[Message]: Reply messages of the call, more than one when
+            the replies are partial.
+        """
+        future = self.submit(message, timeout)
+        return await asyncio.wrap_future(future, loop=self.container.loop)
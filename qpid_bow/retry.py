@@ -0,0 +1,54 @@
+"""Policies for retrying messages that failed to process."""
+
+from datetime import timedelta
+from random import uniform
+from typing import Optional
+
+
+class RetryPolicy:
+    """Retries with exponentially increasing delays up to a maximum amount
+    of attempts.
+
+    The delay before retrying grows by multiplier with every attempt, up to
+    max_delay, and is randomised by jitter so messages failing at the same
+    time don't all get retried at the same time.
+
+    Args:
+        max_attempts: Maximum amount of times to process a message,
+            including the first.
+        initial_delay: Delay before the first retry.
+        max_delay: Maximum delay between retries.
+        multiplier: Factor to increase the delay with per attempt.
+        jitter: Fraction of the delay to randomly add or subtract.
+    """
+    def __init__(self, max_attempts: int = 5,
+                 initial_delay: timedelta = timedelta(seconds=1),
+                 max_delay: timedelta = timedelta(minutes=1),
+                 multiplier: float = 2.0, jitter: float = 0.1) -> None:
+        if max_attempts < 1:
+            raise ValueError("RetryPolicy requires at least one attempt")
+        if not 0 <= jitter <= 1:
+            raise ValueError("RetryPolicy requires a jitter between 0 and 1")
+
+        self.max_attempts = max_attempts
+        self.initial_delay = initial_delay.total_seconds()
+        self.max_delay = max_delay.total_seconds()
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> Optional[float]:
+        """Get the delay before retrying after a failed attempt.
+
+        Args:
+            attempt: Number of the failed attempt, starting at 1.
+
+        Returns:
+            Optional[float]: Seconds to wait before retrying, None when no
+            attempts are left.
+        """
+        if attempt >= self.max_attempts:
+            return None
+
+        delay = min(self.initial_delay * self.multiplier ** (attempt - 1),
+                    self.max_delay)
+        return delay * uniform(1 - self.jitter, 1 + self.jitter)
@@ -0,0 +1,225 @@
+"""Run receivers in multiple supervised worker processes."""
+
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+from datetime import timedelta
+from multiprocessing.connection import wait
+from time import monotonic, sleep
+from typing import Callable, Dict, List, Optional
+
+from qpid_bow import RunState
+from qpid_bow.metrics import Metrics
+from qpid_bow.receiver import Receiver
+
+logger = logging.getLogger()
+
+# Settlement counters kept per worker
+COUNTERS = ('accepted', 'rejected', 'released')
+
+# Maximum seconds between checks of the worker processes
+SUPERVISE_INTERVAL = 1.0
+
+# Seconds between publishing the settlement counts of a worker
+PUBLISH_INTERVAL = 0.5
+
+# Share of the drain timeout workers wait for running callbacks, leaving
+# time to release prefetched messages and close the connection
+WORKER_DRAIN_SHARE = 0.8
+
+ReceiverFactory = Callable[[], Receiver]
+ReportCallback = Callable[[Dict[str, int]], None]
+
+
+class ConsumerRunner:
+    """Runs a Receiver in each of multiple forked worker processes.
+
+    Every worker creates its own Receiver, and with it its own connection.
+    Workers that crash are restarted. On SIGTERM or SIGINT the workers are
+    asked to stop, which drains their Receiver: running callbacks get to
+    complete and prefetched messages are released. Workers are killed when
+    they did not stop within the drain timeout.
+
+    Args:
+        receiver_factory: Function creating the Receiver, called in each
+            worker process.
+        workers: Amount of worker processes.
+        restart_delay: Duration to wait before restarting a crashed worker.
+        drain_timeout: Duration to wait for workers to stop.
+        report_callback: Function to call with the settlement counters
+            summed over all workers.
+        report_interval: Duration between calls to report_callback.
+    """
+    def __init__(self, receiver_factory: ReceiverFactory, workers: int,
+                 restart_delay: timedelta = timedelta(seconds=1),
+                 drain_timeout: timedelta = timedelta(seconds=30),
+                 report_callback: Optional[ReportCallback] = None,
+                 report_interval: timedelta = timedelta(seconds=10)) -> None:
+        self.receiver_factory = receiver_factory
+        self.workers = workers
+        self.restart_delay = restart_delay.total_seconds()
+        self.drain_timeout = drain_timeout.total_seconds()
+        self.report_callback = report_callback
+        self.report_interval = report_interval.total_seconds()
+
+        self.context = multiprocessing.get_context('fork')
+        # Each worker only writes its own counters, so no lock is needed
+        self.counters = self.context.Array(
+            'Q', workers * len(COUNTERS), lock=False)
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.stopping = False
+
+    def stats(self) -> Dict[str, int]:
+        """Get the settlement counters summed over all workers.
+
+        Returns:
+            Dict[str, int]: Amount of messages per settlement.
+        """
+        return {name: sum(self.counters[index::len(COUNTERS)])
+                for index, name in enumerate(COUNTERS)}
+
+    def run(self):
+        """Start the workers and supervise them until they are stopped."""
+        self.stopping = False
+        previous_handlers = {
+            signum: signal.signal(signum, self._on_signal)
+            for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for index in range(self.workers):
+                self._start_worker(index)
+            self._supervise()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def stop(self):
+        """Ask the workers to stop, after draining their messages."""
+        self.stopping = True
+        # Called from signal handlers or other threads while supervising
+        for process in list(self.processes.values()):
+            if process.is_alive():
+                process.terminate()
+
+    def _on_signal(self, signum, frame):  # pylint: disable=unused-argument
+        logger.info("Received signal %s, stopping workers", signum)
+        self.stop()
+
+    def _start_worker(self, index: int):
+        process = self.context.Process(
+            target=run_worker, name=f'qpid-bow-worker-{index}',
+            args=(self.receiver_factory, self.counters,
+                  index * len(COUNTERS),
+                  timedelta(seconds=self.drain_timeout * WORKER_DRAIN_SHARE)))
+        process.start()
+        self.processes[index] = process
+
+    def _supervise(self):
+        next_report = monotonic() + self.report_interval
+        drain_deadline: Optional[float] = None
+        while self.processes:
+            wait([process.sentinel for process in self.processes.values()],
+                 timeout=SUPERVISE_INTERVAL)
+
+            for index, process in list(self.processes.items()):
+                if process.is_alive():
+                    continue
+                del self.processes[index]
+                process.join()
+                if self.stopping:
+                    continue
+                if process.exitcode:
+                    logger.warning("Worker %s exited with %s, restarting",
+                                   index, process.exitcode)
+                    sleep(self.restart_delay)
+                    if not self.stopping:
+                        self._start_worker(index)
+
+            if self.stopping:
+                if drain_deadline is None:
+                    drain_deadline = monotonic() + self.drain_timeout
+                elif monotonic() > drain_deadline:
+                    for process in self.processes.values():
+                        logger.warning("Killing worker %s", process.name)
+                        # Process.kill() requires Python 3.7
+                        os.kill(process.pid, signal.SIGKILL)
+
+            if self.report_callback and monotonic() >= next_report:
+                self.report_callback(self.stats())
+                next_report = monotonic() + self.report_interval
+
+        if self.report_callback:
+            self.report_callback(self.stats())
+
+
+def run_worker(receiver_factory: ReceiverFactory, counters, offset: int,
+               drain_timeout: timedelta = timedelta(seconds=30)):
+    """Run a Receiver in a worker process until it receives SIGTERM, then
+    drain it.
+
+    Args:
+        receiver_factory: Function creating the Receiver.
+        counters: Shared array of settlement counters.
+        offset: Index of the first counter of this worker.
+        drain_timeout: Duration to wait for running callbacks on SIGTERM.
+    """
+    stopping = False
+
+    def on_sigterm(signum, frame):  # pylint: disable=unused-argument
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    # Interrupts are handled by the supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    receiver = receiver_factory()
+    if receiver.metrics is None:
+        receiver.metrics = Metrics()
+    # Counts of earlier runs of this worker, before being restarted
+    base_counts = counters[offset:offset + len(COUNTERS)]
+
+    def publish():
+        publish_settlements(receiver.metrics, counters, offset, base_counts)
+        # Leave the container without work once the Receiver stopped
+        if receiver.run_state not in (RunState.stopped, RunState.failed):
+            receiver.schedule(PUBLISH_INTERVAL, publish)
+
+    try:
+        receiver.open()
+        receiver.schedule(PUBLISH_INTERVAL, publish)
+        # The Receiver is still stopped until the container processed its
+        # start, processing ends by itself once it stopped again
+        receiver.process_until(
+            lambda: stopping or receiver.run_state == RunState.failed)
+        failed = receiver.run_state == RunState.failed
+        if stopping and not failed:
+            receiver.drain(drain_timeout)
+            receiver.process_until(
+                lambda: receiver.run_state in (RunState.stopped,
+                                               RunState.failed))
+        receiver.close()
+    finally:
+        publish_settlements(receiver.metrics, counters, offset, base_counts)
+    sys.exit(1 if failed else 0)
+
+
+def publish_settlements(metrics: Metrics, counters, offset: int,
+                        base_counts: List[int]):
+    """Publish the settlements counted by the metrics of a Receiver in
+    shared counters.
+
+    Args:
+        metrics: Metrics of the Receiver.
+        counters: Shared array of settlement counters.
+        offset: Index of the first counter to use.
+        base_counts: Counts to add, of earlier runs of the worker.
+    """
+    counts = dict.fromkeys(COUNTERS, 0)
+    for (name, _, outcome), value in list(metrics.counters.items()):
+        if name == 'settled_total' and outcome in counts:
+            counts[outcome] += int(value)
+
+    for index, name in enumerate(COUNTERS):
+        counters[offset + index] = base_counts[index] + counts[name]
@@ -1,17 +1,62 @@
 """Send messages to AMPQ broker."""
 
+import asyncio
 import logging
-from typing import Iterable, Optional
+from collections import OrderedDict, deque
+from collections.abc import Collection
+from datetime import timedelta
+from enum import Enum, auto
+from time import monotonic
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Type,
+    Union,
+)
 from uuid import uuid4
 from warnings import warn
 
-from proton import Message
+from proton import Delivery, Link, Message
+from proton.reactor import AtMostOnce, Container, Task
 
 from qpid_bow import Connector, ReconnectStrategy, RunState
+from qpid_bow.dedupe import DedupeWindow
 from qpid_bow.exc import UnroutableMessage
+from qpid_bow.message import MessageBatch, content_id
+from qpid_bow.metrics import Metrics
+from qpid_bow.rate_limit import TokenBucket
 
 logger = logging.getLogger()
 
+# Maximum amount of messages buffered for links of a link pool
+LINK_POOL_BUFFER = 1024
+
+
+MessageSource = Union[Iterable[Message], AsyncIterable[Message]]
+
+
+class SendOutcome(Enum):
+    """Outcome of a confirmed message as settled by the broker."""
+    accepted = auto()
+    rejected = auto()
+    # Released by the broker or lost on connection drop, safe to resend
+    released = auto()
+    # Dropped without sending, as a duplicate of a message sent before
+    duplicate = auto()
+
+
+ConfirmCallback = Callable[[Message, SendOutcome], None]
+
 
 class Sender(Connector):
     """Class to send messages in a batch to an AMQP address.
@@ -22,49 +67,652 @@ class Sender(Connector):
             Multiple can be specified for connection fallback, the first
             should be the primary server.
         reconnect_strategy: Strategy to use on connection drop.
+        container_class: Qpid Proton reactor container-class to use.
+        persistent: Keep the connection and link open after sending, to be
+            reused by the next call to :obj:`send` until :obj:`close` is
+            called.
+        confirm_window: Wait for the broker to settle sent messages, keeping
+            up to this amount of messages unsettled in flight.
+        confirm_callback: Function to call with each confirmed message and
+            its outcome.
+        link_pool_size: For a Sender with no address, open a link per
+            Message.address instead of using the anonymous relay, keeping up
+            to this amount of links open. Links with messages waiting for
+            credit or confirmation are not closed, which may temporarily
+            exceed this amount.
+        link_idle_timeout: Close links of the link pool that were not used
+            for this duration.
+        content_ids: Derive Message.id from the message body and the
+            properties named in content_id_properties, instead of using a
+            random ID.
+        content_id_properties: Names of the message properties to include
+            when deriving the message ID. A Sender with no address also
+            includes Message.address.
+        dedupe_window: Drop messages with an ID already sent within this
+            window, or still being sent, reporting them to confirm_callback
+            as duplicate. With a confirm_window, messages only count as sent
+            once accepted, so released and rejected messages can be resent.
+            Implies content_ids.
+        batch_max_bytes: Pack messages in batch envelopes, see
+            :obj:`qpid_bow.message.MessageBatch`, sending an envelope once its
+            messages reach this encoded size. A Sender with no address packs
+            messages per Message.address. Confirmations apply to whole
+            envelopes, which requires receivers to unpack them, like
+            :obj:`qpid_bow.receiver.Receiver` does.
+        batch_linger: Wait up to this duration for a batch envelope to fill
+            up. Without it, envelopes are sent as soon as no more messages are
+            available right away.
+        rate_limit: Limit the amount of messages sent per second, counting a
+            batch envelope as one message.
+        byte_rate_limit: Limit the amount of encoded message bytes sent per
+            second.
+        presettled: Send messages pre-settled, at most once, without the
+            broker confirming them. Can not be combined with confirm_window.
+        metrics: Collect metrics of sent messages.
     """
 
     def __init__(
             self, address: Optional[str] = None,
             server_url: Optional[str] = None,
-            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.failover
+            reconnect_strategy: ReconnectStrategy = ReconnectStrategy.failover,
+            container_class: Type[Any] = Container,
+            persistent: bool = False,
+            confirm_window: Optional[int] = None,
+            confirm_callback: Optional[ConfirmCallback] = None,
+            link_pool_size: Optional[int] = None,
+            link_idle_timeout: Optional[timedelta] = None,
+            content_ids: bool = False,
+            content_id_properties: Sequence[str] = (),
+            dedupe_window: Optional[DedupeWindow] = None,
+            batch_max_bytes: Optional[int] = None,
+            batch_linger: Optional[timedelta] = None,
+            rate_limit: Optional[TokenBucket] = None,
+            byte_rate_limit: Optional[TokenBucket] = None,
+            presettled: bool = False,
+            metrics: Optional[Metrics] = None
     ) -> None:
-        super().__init__(server_url, reconnect_strategy=reconnect_strategy)
+        super().__init__(server_url, container_class=container_class,
+                         reconnect_strategy=reconnect_strategy)
         if self.reconnect_strategy == ReconnectStrategy.backoff:
             warn("Using ReconnectStrategy.backoff may cause Sender to block")
+        if presettled and confirm_window:
+            raise ValueError("A presettled Sender can not confirm messages")
         self.address = address
-        self.send_queue: list = []
+        self.persistent = persistent
+        self.sender_link: Optional[Link] = None
+        self.confirm_window = confirm_window
+        self.confirm_callback = confirm_callback
+        self.unsettled: Dict[Delivery, Message] = {}
+        # Unsettled messages per address, for metrics
+        self.unsettled_counts: Dict[str, int] = {}
+        self.presettled = presettled
+        self.metrics = metrics
+
+        # Links per address in least recently used order
+        self.link_pool: Optional[OrderedDict] = None
+        if link_pool_size and not address:
+            self.link_pool = OrderedDict()
+        self.link_pool_size = link_pool_size
+        self.link_idle_timeout = link_idle_timeout
+        self.link_last_used: Dict[str, float] = {}
+        self.link_queues: Dict[str, Deque[Message]] = {}
+        self.link_queued = 0
+        self.idle_task: Task = None
 
-    def queue(self, messages: Iterable[Message]):
-        """Enqueue messages that will be send on calling :obj:`send`."""
-        if not self.address:
-            if any((new_message.address is None for new_message in messages)):
-                raise UnroutableMessage(
-                    "A Sender with no address requires Message.address is set")
+        self.content_ids = content_ids or dedupe_window is not None
+        self.content_id_properties = content_id_properties
+        self.dedupe_window = dedupe_window
+        # IDs of messages being sent but not remembered as sent yet
+        self.pending_ids: Set[Any] = set()
+        # IDs of the messages in batch envelopes being sent
+        self.envelope_ids: Dict[Message, List[Any]] = {}
 
-        self.send_queue.extend(messages)
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_linger = batch_linger
+        # Batches being filled per address, None when the Sender has one
+        self.batches: Dict[Optional[str], MessageBatch] = OrderedDict()
+        self.linger_task: Task = None
+        self.closing = False
+
+        self.rate_limit = rate_limit
+        self.byte_rate_limit = byte_rate_limit
+        self.throttle_task: Task = None
+
+        # Messages pulled ahead from a source, ready to be sent
+        self.send_queue: Deque[Message] = deque()
+        # Messages fetched from an async source
+        self.fetched_messages: Deque[Message] = deque()
+        self.message_sources: Deque[
+            Union[Iterator[Message], AsyncIterator[Message]]] = deque()
+        self.fetch_task: Optional[asyncio.Future] = None
+
+    def queue(self, messages: MessageSource):
+        """Enqueue messages that will be send on calling :obj:`send`.
+
+        Collections of messages are checked to be routable right away. Other
+        iterables and async iterables, like generators, are consumed lazily:
+        messages are only pulled when the link has credit to send them and are
+        checked to be routable one at a time.
+
+        Args:
+            messages: Collection, iterable or async iterable of messages.
+        """
+        if isinstance(messages, Collection):
+            if not self.address:
+                if any((new_message.address is None
+                        for new_message in messages)):
+                    raise UnroutableMessage("A Sender with no address "
+                                            "requires Message.address is set")
+            self.message_sources.append(iter(messages))
+        elif hasattr(messages, '__aiter__'):
+            self.message_sources.append(
+                messages.__aiter__())  # type: ignore
+        else:
+            self.message_sources.append(iter(messages))  # type: ignore
 
     def send(self):
-        """Send queued messages."""
-        # Give control to container to do our sending
-        if self.send_queue:
+        """Send queued messages.
+
+        A persistent Sender returns once all queued messages are written to
+        the connection, which is only serviced during calls to :obj:`send` and
+        :obj:`close` when using a blocking container.
+        """
+        if not self._has_pending():
+            return
+
+        if not self.persistent:
+            # Give control to container to do our sending
             self.run()
+            return
+
+        if self.run_state == RunState.stopped:
+            self.open()
+        elif self.connection:
+            self._send_available(self.sender_link)
+
+        self.process_until(self._is_flushed)
+
+    def close(self):
+        """Send messages still queued, wait for them to be confirmed and close
+        the connection of a persistent Sender."""
+        self.closing = True
+        try:
+            self.send()
+            if self.run_state == RunState.stopped:
+                # Never opened, or already closed
+                return
+
+            self.process_until(lambda: not self.unsettled)
+            super().close()
+        finally:
+            self.closing = False
+
+    def stop(self):
+        if self.fetch_task:
+            self.fetch_task.cancel()
+            self.fetch_task = None
+
+        if self.idle_task:
+            self.idle_task.cancel()
+            self.idle_task = None
+
+        if self.linger_task:
+            self.linger_task.cancel()
+            self.linger_task = None
+
+        if self.throttle_task:
+            self.throttle_task.cancel()
+            self.throttle_task = None
+
+        if self.link_pool:
+            self.link_pool.clear()
+            self.link_last_used.clear()
+
+        super().stop()
 
     def on_start(self, event):
         super().on_start(event)
-        if self.run_state == RunState.started:
-            event.container.create_sender(self.connection, self.address)
+        if self.run_state != RunState.started:
+            return
+
+        if self.link_pool is None:
+            self.sender_link = event.container.create_sender(
+                self.connection, self.address, options=self._link_options())
+        else:
+            if self.link_idle_timeout:
+                self.idle_task = self.schedule(
+                    self.link_idle_timeout.total_seconds(),
+                    self._close_idle_links)
+            for address in self.link_queues:
+                self._get_pooled_link(address)
+            self._send_available(None)
 
     def on_sendable(self, event):
-        """Handles sendable event, sends all the messages in the send_queue."""
+        """Handles sendable event, sends as many queued messages as the link
+        credit allows."""
+        if not self.connection:
+            return
+
+        self._send_available(event.sender)
+
+    def on_accepted(self, event):
+        self._confirm(event, SendOutcome.accepted)
+
+    def on_rejected(self, event):
+        self._confirm(event, SendOutcome.rejected)
+
+    def on_released(self, event):
+        self._confirm(event, SendOutcome.released)
+
+    def on_transport_error(self, event):
+        for message in self.unsettled.values():
+            self._settle_ids(message, False)
+            self._call_confirm_callback(message, SendOutcome.released)
+        self.unsettled.clear()
+        if self.metrics:
+            for address in self.unsettled_counts:
+                self.metrics.set('unsettled', address, 0)
+        self.unsettled_counts.clear()
+
+        super().on_transport_error(event)
+
+    def _confirm(self, event, outcome: SendOutcome):
+        message = self.unsettled.pop(event.delivery, None)
+        if message is None:
+            return
+
+        self._settle_ids(message, outcome == SendOutcome.accepted)
+        self._count_unsettled(message, -1)
+        self._call_confirm_callback(message, outcome)
         if not self.connection:
             return
 
-        message = self.send_queue.pop(0)
-        message.id = uuid4()
-        # TODO SHA
-        event.sender.send(message)
+        # Window has room again
+        self._resume()
+
+    def _resume(self):
+        """Send messages held back by the confirm window or rate limits."""
+        if self.link_pool is None:
+            self._send_available(self.sender_link)
+            return
+
+        for address in list(self.link_queues):
+            link = self.link_pool.get(address)
+            if link is not None and link.credit:
+                self._send_link_queue(link)
+        self._send_available(None)
+
+    def _call_confirm_callback(self, message: Message, outcome: SendOutcome):
+        if self.metrics:
+            self.metrics.increment('confirmed_total',
+                                   self.address or message.address,
+                                   outcome.name)
+
+        if self.confirm_callback:
+            self.confirm_callback(message, outcome)
+
+    def _send_available(self, sender: Optional[Link]):
+        if self.link_pool is None:
+            self._send_from_sources(sender)
+        else:
+            if sender is not None:
+                self._send_link_queue(sender)
+            self._route_from_sources()
 
-        if not self.send_queue:
+        if (not self._has_pending() and not self.unsettled and
+                not self.persistent):
             # We are done sending, clear & return control
             self.stop()
+
+    def _send_from_sources(self, sender: Link):
+        while not self._is_throttled():
+            message = self._next_message(max(sender.credit, 1))
+            if message is None:
+                break
+
+            if not sender.credit:
+                # Keep the message pulled ahead, which tells us if the
+                # sources got exhausted without waiting for more credit
+                self.send_queue.appendleft(message)
+                break
+
+            self._deliver(sender, message)
+
+    def _deliver(self, sender: Link, message: Message):
+        if self.batch_max_bytes:
+            # Messages in the envelope got their ID when being packed
+            message.id = uuid4()
+        elif not self._assign_id(message):
+            return
+
+        if self.byte_rate_limit:
+            delivery = self._send_encoded(sender, message)
+        else:
+            delivery = sender.send(message)
+        if self.confirm_window:
+            self.unsettled[delivery] = message
+        else:
+            # Unconfirmed messages count as sent once written to the link
+            self._settle_ids(message, True)
+        if self.rate_limit:
+            self.rate_limit.consume()
+        if self.metrics:
+            self.metrics.increment('sent_total',
+                                   self.address or message.address)
+            if self.confirm_window:
+                self._count_unsettled(message, 1)
+
+    def _count_unsettled(self, message: Message, change: int):
+        """Update the unsettled gauge of the address of a message."""
+        if not self.metrics:
+            return
+
+        address = self.address or message.address
+        count = self.unsettled_counts.get(address, 0) + change
+        self.unsettled_counts[address] = count
+        self.metrics.set('unsettled', address, count)
+
+    def _send_encoded(self, sender: Link, message: Message) -> Delivery:
+        """Send a message like Link.send does, consuming its encoded size
+        from the byte rate limit without encoding it twice."""
+        encoded = message.encode()
+        self.byte_rate_limit.consume(len(encoded))
+        delivery = sender.delivery(sender.delivery_tag())
+        sender.stream(encoded)
+        sender.advance()
+        if sender.snd_settle_mode == Link.SND_SETTLED:
+            delivery.settle()
+        return delivery
+
+    def _assign_id(self, message: Message) -> bool:
+        """Set the ID of a message.
+
+        Returns:
+            bool: False when the message is a duplicate that should be
+            dropped.
+        """
+        if not self.content_ids:
+            message.id = uuid4()
+            return True
+
+        message.id = content_id(message, self.content_id_properties,
+                                include_address=not self.address)
+        if self.dedupe_window is None:
+            return True
+
+        if message.id in self.dedupe_window or message.id in self.pending_ids:
+            logger.debug("Dropping duplicate message %s", message.id)
+            self._call_confirm_callback(message, SendOutcome.duplicate)
+            return False
+
+        self.pending_ids.add(message.id)
+        return True
+
+    def _settle_ids(self, message: Message, sent: bool):
+        """Remember the IDs of a message or batch envelope as sent, or
+        allow them to be sent again when the message did not arrive."""
+        if self.dedupe_window is None:
+            return
+
+        message_ids = self.envelope_ids.pop(message, None)
+        if message_ids is None:
+            message_ids = [message.id]
+        for message_id in message_ids:
+            self.pending_ids.discard(message_id)
+            if sent:
+                self.dedupe_window.seen(message_id)
+
+    def _create_envelope(self, address: Optional[str]) -> Message:
+        batch = self.batches.pop(address)
+        envelope = batch.create_envelope()
+        if self.dedupe_window is not None:
+            self.envelope_ids[envelope] = batch.message_ids
+        return envelope
+
+    def _is_window_full(self) -> bool:
+        return bool(self.confirm_window and
+                    len(self.unsettled) >= self.confirm_window)
+
+    def _is_throttled(self) -> bool:
+        """Check if sending has to wait for the confirm window or the rate
+        limits, scheduling a timer to resume once the rate limits allow."""
+        if self._is_window_full():
+            return True
+
+        wait_time = max((bucket.wait_time() for bucket
+                         in (self.rate_limit, self.byte_rate_limit)
+                         if bucket), default=0)
+        if not wait_time:
+            return False
+
+        if not self.throttle_task:
+            self.throttle_task = self.schedule(wait_time, self._on_throttled)
+        return True
+
+    def _on_throttled(self):
+        self.throttle_task = None
+        if self.connection:
+            self._resume()
+
+    def _route_from_sources(self):
+        """Pull messages from the sources and send them over the pooled link
+        of their address, buffering those waiting for link credit."""
+        while (self.link_queued < LINK_POOL_BUFFER and
+               not self._is_throttled()):
+            message = self._next_message(LINK_POOL_BUFFER - self.link_queued)
+            if message is None:
+                break
+
+            link = self._get_pooled_link(message.address)
+            if link.credit and message.address not in self.link_queues:
+                self._deliver(link, message)
+            else:
+                self.link_queues.setdefault(
+                    message.address, deque()).append(message)
+                self.link_queued += 1
+
+    def _send_link_queue(self, sender: Link):
+        address = sender.target.address
+        queue = self.link_queues.get(address)
+        while queue and sender.credit and not self._is_throttled():
+            self._deliver(sender, queue.popleft())
+            self.link_queued -= 1
+
+        if not queue:
+            self.link_queues.pop(address, None)
+
+    def _get_pooled_link(self, address: str) -> Link:
+        self.link_last_used[address] = monotonic()
+        link = self.link_pool.get(address)
+        if link is not None:
+            self.link_pool.move_to_end(address)
+            return link
+
+        # Make room by closing the least recently used idle links
+        for lru_address, lru_link in list(self.link_pool.items()):
+            if len(self.link_pool) < self.link_pool_size:
+                break
+            if self._is_link_idle(lru_address, lru_link):
+                self._close_pooled_link(lru_address)
+
+        link = self.container.create_sender(self.connection, address,
+                                            options=self._link_options())
+        self.link_pool[address] = link
+        return link
+
+    def _link_options(self) -> Optional[AtMostOnce]:
+        # Pre-settled deliveries are settled by proton right after sending
+        return AtMostOnce() if self.presettled else None
+
+    def _is_link_idle(self, address: str, link: Link) -> bool:
+        return address not in self.link_queues and not link.unsettled
+
+    def _close_pooled_link(self, address: str):
+        self.link_pool.pop(address).close()
+        del self.link_last_used[address]
+
+    def _close_idle_links(self):
+        """Close links of the link pool that have been idle for too long."""
+        if not self.connection:
+            return
+
+        idle_timeout = self.link_idle_timeout.total_seconds()
+        idle_since = monotonic() - idle_timeout
+        for address, link in list(self.link_pool.items()):
+            if self.link_last_used[address] > idle_since:
+                break
+            if self._is_link_idle(address, link):
+                self._close_pooled_link(address)
+
+        self.idle_task = self.schedule(idle_timeout, self._close_idle_links)
+
+    def _has_pending(self, include_batches: bool = True) -> bool:
+        return bool(self.send_queue or self.fetched_messages or
+                    self.message_sources or self.fetch_task or
+                    self.link_queued or (include_batches and self.batches))
+
+    def _is_flushed(self) -> bool:
+        # A persistent Sender may keep batches lingering between sends
+        lingering = bool(self.batch_linger and not self.closing)
+        if (self._has_pending(include_batches=not lingering) or
+                not self.connection):
+            return False
+
+        transport = self.connection.transport
+        return transport is None or not transport.pending()
+
+    def _next_message(self, count: int) -> Optional[Message]:
+        """Get the next message to send, which is a batch envelope when
+        batching.
+
+        Args:
+            count: Amount of messages to pull ahead from an async source.
+
+        Returns:
+            Optional[Message]: Next message or None when none is available
+            yet.
+        """
+        if self.send_queue:
+            return self.send_queue.popleft()
+
+        if not self.batch_max_bytes:
+            return self._pull_message(count)
+
+        while True:
+            message = self._pull_message(count)
+            if message is None:
+                return self._flush_batch()
+            if not self._assign_id(message):
+                continue
+
+            address = None if self.address else message.address
+            batch = self.batches.get(address)
+            if batch is None:
+                batch = self.batches[address] = MessageBatch(address)
+                if self.batch_linger and not self.linger_task:
+                    self.linger_task = self.schedule(
+                        self.batch_linger.total_seconds(), self._on_linger)
+
+            batch.add(message)
+            if batch.size >= self.batch_max_bytes:
+                return self._create_envelope(address)
+
+    def _flush_batch(self) -> Optional[Message]:
+        """Take the oldest batch if it is due to be sent.
+
+        Returns:
+            Optional[Message]: Batch envelope or None when no batch is due.
+        """
+        if not self.batches:
+            return None
+
+        address, batch = next(iter(self.batches.items()))
+        exhausted = not (self.message_sources or self.fetch_task)
+        if (not self.batch_linger or
+                (monotonic() - batch.created >=
+                 self.batch_linger.total_seconds()) or
+                (exhausted and (not self.persistent or self.closing))):
+            return self._create_envelope(address)
+
+        return None
+
+    def _on_linger(self):
+        self.linger_task = None
+        if not self.connection:
+            return
+
+        self._send_available(self.sender_link)
+        if self.batches and self.connection:
+            oldest = next(iter(self.batches.values()))
+            self.linger_task = self.schedule(
+                max(self.batch_linger.total_seconds() -
+                    (monotonic() - oldest.created), 0), self._on_linger)
+
+    def _pull_message(self, count: int) -> Optional[Message]:
+        """Pull the next message from the queued message sources.
+
+        Args:
+            count: Amount of messages to pull ahead from an async source.
+
+        Returns:
+            Optional[Message]: Next message or None when none is available
+            yet, either because all sources are exhausted or because an
+            async source is being waited on.
+        """
+        while not self.fetched_messages and self.message_sources:
+            source = self.message_sources[0]
+            if not hasattr(source, '__anext__'):
+                try:
+                    return self._check_routable(next(source))  # type: ignore
+                except StopIteration:
+                    self.message_sources.popleft()
+                    continue
+
+            if self.fetch_task:
+                return None
+
+            loop = asyncio.get_event_loop()
+            if not loop.is_running():
+                loop.run_until_complete(self._fetch(source, count))
+            else:
+                self.fetch_task = asyncio.ensure_future(
+                    self._fetch(source, count), loop=loop)
+                self.fetch_task.add_done_callback(self._on_fetched)
+                return None
+
+        if self.fetched_messages:
+            return self.fetched_messages.popleft()
+
+        return None
+
+    async def _fetch(self, source: AsyncIterator[Message], count: int):
+        for _ in range(count):
+            try:
+                message = await source.__anext__()
+            except StopAsyncIteration:
+                self.message_sources.popleft()
+                return
+
+            self.fetched_messages.append(self._check_routable(message))
+
+    def _on_fetched(self, future: asyncio.Future):
+        self.fetch_task = None
+        if future.cancelled() or not self.connection:
+            return
+
+        if future.exception():
+            logger.error("Failed to pull messages from async source",
+                         exc_info=future.exception())
+            self.stop()
+            return
+
+        self._send_available(self.sender_link)
+        self.touch()
+
+    def _check_routable(self, message: Message) -> Message:
+        if not self.address and message.address is None:
+            self.stop()
+            raise UnroutableMessage(
+                "A Sender with no address requires Message.address is set")
+
+        return message
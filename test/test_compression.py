@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from proton import symbol
+
+from qpid_bow.compression import (
+    CODECS,
+    compress_message,
+    decompress_message,
+    register_codec,
+)
+from qpid_bow.message import create_message
+
+
+class TestCompression(TestCase):
+    def setUp(self):
+        self.body = {'foo': 'bar' * 2048, 'baz': [1, 2, 3]}
+
+    def test_roundtrip(self):
+        for codec in ('zlib', 'lzma'):
+            message = create_message(self.body, compression=codec)
+            self.assertEqual(message.content_encoding, codec)
+            self.assertIsInstance(message.body, bytes)
+
+            decompress_message(message)
+            self.assertEqual(message.body, self.body)
+            self.assertEqual(message.content_encoding, symbol('None'))
+
+    def test_below_threshold(self):
+        message = create_message(b'foobar', compression='zlib')
+        self.assertEqual(message.content_encoding, symbol('None'))
+        self.assertEqual(message.body, b'foobar')
+
+    def test_threshold(self):
+        message = create_message(b'foobar', compression='zlib',
+                                 compression_threshold=0)
+        self.assertEqual(message.content_encoding, 'zlib')
+        self.assertEqual(decompress_message(message).body, b'foobar')
+
+    def test_unknown_encoding(self):
+        message = create_message(b'foobar')
+        message.content_encoding = 'foo'
+        self.assertEqual(decompress_message(message).body, b'foobar')
+
+    def test_register_codec(self):
+        register_codec('reversed', lambda data: data[::-1],
+                       lambda data: data[::-1])
+        try:
+            message = compress_message(create_message(b'foobar'),
+                                       'reversed', threshold=0)
+            self.assertEqual(message.content_encoding, 'reversed')
+            self.assertEqual(decompress_message(message).body, b'foobar')
+        finally:
+            del CODECS['reversed']
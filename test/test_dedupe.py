@@ -0,0 +1,68 @@
+from datetime import timedelta
+from time import sleep
+from unittest import TestCase
+
+from qpid_bow.dedupe import BloomWindow, DedupeWindow
+
+
+class TestDedupeWindow(TestCase):
+    def test_unbounded(self):
+        with self.assertRaises(ValueError):
+            DedupeWindow()
+
+    def test_seen(self):
+        window = DedupeWindow(max_entries=10)
+        self.assertFalse(window.seen('foo'))
+        self.assertTrue(window.seen('foo'))
+        self.assertFalse(window.seen('bar'))
+        self.assertIn('foo', window)
+
+    def test_max_entries(self):
+        window = DedupeWindow(max_entries=2)
+        for key in ('foo', 'bar', 'baz'):
+            window.seen(key)
+
+        self.assertEqual(len(window), 2)
+        self.assertNotIn('foo', window)
+        self.assertFalse(window.seen('foo'))
+
+    def test_max_age(self):
+        window = DedupeWindow(max_age=timedelta(milliseconds=50))
+        window.seen('foo')
+        self.assertTrue(window.seen('foo'))
+
+        sleep(0.1)
+        self.assertNotIn('foo', window)
+        self.assertFalse(window.seen('foo'))
+
+
+class TestBloomWindow(TestCase):
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            BloomWindow(0)
+        with self.assertRaises(ValueError):
+            BloomWindow(10, error_rate=1)
+
+    def test_seen(self):
+        window = BloomWindow(100)
+        self.assertFalse(window.seen('foo'))
+        self.assertTrue(window.seen('foo'))
+        self.assertIn('foo', window)
+        self.assertEqual(len(window), 1)
+
+    def test_generations(self):
+        window = BloomWindow(100)
+        for key in range(250):
+            window.seen(key)
+
+        self.assertNotIn(0, window)
+        self.assertIn(100, window)
+        self.assertIn(249, window)
+
+    def test_error_rate(self):
+        window = BloomWindow(1000, error_rate=0.01)
+        for key in range(1000):
+            window.seen(key)
+
+        false_duplicates = sum(key in window for key in range(1000, 11000))
+        self.assertLess(false_duplicates, 200)
@@ -1,13 +1,18 @@
+import socket
+from collections import deque
 from datetime import timedelta
+from threading import Thread
 from unittest import TestCase
 from uuid import uuid4
 
-from proton import Message
+from proton import Message, Url
 
 from qpid_bow.config import configure
+from qpid_bow.management import create_QMF2_query
 from qpid_bow.management.queue import create_queue
 from qpid_bow.message import create_message
 from qpid_bow.receiver import Receiver
+from qpid_bow.remote_procedure import RemoteProcedureClient
 from qpid_bow.sender import Sender
 
 from . import TEST_AMQP_SERVER
@@ -46,3 +51,73 @@ class TestFailoverReceiver(TestCase):
                                       expected_messages):
             self.assertEqual(received.id, expected.id)
             self.assertEqual(received.body, expected.body)
+
+
+class Proxy:
+    """TCP proxy to the test server, dropping all connections through it
+    like a failing server once closed."""
+    def __init__(self, server_url: str) -> None:
+        self.url = Url(server_url)
+        self.server = (self.url.host, int(self.url.port))
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen()
+        self.sockets = []
+        Thread(target=self._accept, daemon=True).start()
+
+        self.url.host, self.url.port = self.listener.getsockname()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            server = socket.create_connection(self.server)
+            self.sockets.extend((client, server))
+            for source, target in ((client, server), (server, client)):
+                Thread(target=self._forward, args=(source, target),
+                       daemon=True).start()
+
+    @staticmethod
+    def _forward(source: socket.socket, target: socket.socket):
+        try:
+            data = source.recv(65536)
+            while data:
+                target.sendall(data)
+                data = source.recv(65536)
+        except OSError:
+            pass
+
+    def close(self):
+        for sock in [self.listener] + self.sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+class TestFailoverRemoteProcedureClient(TestCase):
+    def setUp(self):
+        configure({'amqp_url': TEST_AMQP_SERVER})
+        self.proxy = Proxy(TEST_AMQP_SERVER)
+        self.client = RemoteProcedureClient(
+            'qmf.default.direct',
+            server_url=f'{self.proxy.url}, {TEST_AMQP_SERVER}')
+        self.client.open()
+
+    def tearDown(self):
+        self.client.close()
+        self.proxy.close()
+
+    def test_failover_call(self):
+        query = create_QMF2_query('org.apache.qpid.broker', 'broker')
+        self.assertEqual(len(self.client.call(query)), 1)
+
+        self.proxy.close()
+        self.client.process_until(lambda: self.client.failover_count)
+        query = create_QMF2_query('org.apache.qpid.broker', 'broker')
+        replies = self.client.call(query, timeout=timedelta(seconds=10))
+        self.assertIn('_object_id', replies[-1].body[0])
+        self.assertEqual(self.client.unsent, deque())
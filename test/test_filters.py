@@ -0,0 +1,33 @@
+from unittest import TestCase
+
+from proton import symbol
+
+from qpid_bow.filters import (
+    HEADERS_FILTER,
+    SELECTOR_FILTER,
+    SUBJECT_FILTER,
+    link_filter,
+)
+
+
+class TestLinkFilter(TestCase):
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            link_filter()
+
+    def test_selector(self):
+        filter_set = link_filter(selector="region = 'eu'").filter_set
+        described = filter_set[symbol('selector')]
+        self.assertEqual(described.descriptor, SELECTOR_FILTER)
+        self.assertEqual(described.value, "region = 'eu'")
+
+    def test_combined(self):
+        filter_set = link_filter(subject='orders.#',
+                                 headers={'region': 'eu'},
+                                 match_all=False).filter_set
+        self.assertEqual(filter_set[symbol('subject')].descriptor,
+                         SUBJECT_FILTER)
+        self.assertEqual(filter_set[symbol('headers')].descriptor,
+                         HEADERS_FILTER)
+        self.assertEqual(filter_set[symbol('headers')].value,
+                         {'region': 'eu', 'x-match': 'any'})
@@ -5,7 +5,17 @@ from proton import symbol
 
 from qpid_bow import Priority
 from qpid_bow.exc import UnroutableMessage
-from qpid_bow.message import create_message, create_reply
+from qpid_bow.message import (
+    BATCH_CONTENT_TYPE,
+    LazyMessage,
+    MessageBatch,
+    body_offset,
+    content_id,
+    create_message,
+    create_reply,
+    decode_message,
+    unpack_batch,
+)
 
 
 class TestMesageCreate(TestCase):
@@ -37,6 +47,91 @@ class TestMesageCreateDefault(TestCase):
         self.assertTrue(self.message.durable)
 
 
+class TestMessageContentId(TestCase):
+    def test_identical(self):
+        self.assertEqual(
+            content_id(create_message({'foo': 'bar'}, {'baz': 1})),
+            content_id(create_message({'foo': 'bar'}, {'baz': 2})))
+
+    def test_body(self):
+        self.assertNotEqual(content_id(create_message(b'foo')),
+                            content_id(create_message(b'bar')))
+
+    def test_properties(self):
+        self.assertNotEqual(
+            content_id(create_message(b'foo', {'baz': 1}), ['baz']),
+            content_id(create_message(b'foo', {'baz': 2}), ['baz']))
+
+    def test_address(self):
+        message1 = create_message(b'foo')
+        message1.address = 'foo'
+        message2 = create_message(b'foo')
+        message2.address = 'bar'
+        self.assertEqual(content_id(message1), content_id(message2))
+        self.assertNotEqual(content_id(message1, include_address=True),
+                            content_id(message2, include_address=True))
+
+
+class TestLazyMessage(TestCase):
+    def setUp(self):
+        self.message = create_message({'foo': b'bar' * 1000}, {'baz': 1},
+                                      priority=Priority.high)
+        self.message.subject = 'foobar'
+        self.data = self.message.encode()
+
+    def test_body_offset(self):
+        header = decode_message(self.data[:body_offset(self.data)])
+        self.assertEqual(header.properties, {'baz': 1})
+        self.assertIsNone(header.body)
+
+    def test_header(self):
+        message = LazyMessage(self.data)
+        self.assertEqual(message.properties, {'baz': 1})
+        self.assertEqual(message.subject, 'foobar')
+        self.assertEqual(message.priority, Priority.high.value)
+        self.assertFalse(message.body_decoded)
+
+    def test_body(self):
+        message = LazyMessage(self.data)
+        self.assertEqual(message.body, self.message.body)
+        self.assertTrue(message.body_decoded)
+
+    def test_set_body(self):
+        message = LazyMessage(self.data)
+        message.body = b'foobar'
+        self.assertEqual(decode_message(message.encode()).body, b'foobar')
+
+
+class TestMessageBatch(TestCase):
+    def setUp(self):
+        self.messages = [
+            create_message(b'foo', {'baz': 1}, priority=Priority.low),
+            create_message(b'bar', priority=Priority.high)]
+        self.messages[1].durable = False
+        self.batch = MessageBatch('foobar')
+        for message in self.messages:
+            self.batch.add(message)
+        self.envelope = self.batch.create_envelope()
+
+    def test_envelope(self):
+        self.assertEqual(self.envelope.content_type, BATCH_CONTENT_TYPE)
+        self.assertEqual(self.envelope.address, 'foobar')
+        self.assertEqual(self.envelope.priority, Priority.high.value)
+        self.assertTrue(self.envelope.durable)
+        self.assertEqual(self.batch.size,
+                         sum(len(data) for data in self.envelope.body))
+
+    def test_unpack(self):
+        unpacked = unpack_batch(self.envelope)
+        self.assertEqual([message.body for message in unpacked],
+                         [b'foo', b'bar'])
+        self.assertEqual(unpacked[0].properties, {'baz': 1})
+
+    def test_unpack_no_batch(self):
+        message = self.messages[0]
+        self.assertEqual(unpack_batch(message), [message])
+
+
 class TestMessageCreateReply(TestCase):
     def setUp(self):
         self.properties = {'foo': 'bar'}
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+from qpid_bow.metrics import Metrics
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.1, 1))
+
+    def test_counter(self):
+        self.metrics.increment('settled_total', 'foo', 'accepted')
+        self.metrics.increment('settled_total', 'foo', 'accepted')
+        self.metrics.increment('settled_total', 'foo', 'rejected')
+        samples = self.metrics.snapshot()['settled_total']
+        self.assertEqual(
+            samples,
+            [{'labels': {'address': 'foo', 'outcome': 'accepted'},
+              'value': 2},
+             {'labels': {'address': 'foo', 'outcome': 'rejected'},
+              'value': 1}])
+
+    def test_gauge(self):
+        self.metrics.set('in_flight', 'foo', 3)
+        self.metrics.set('in_flight', 'foo', 1)
+        self.assertEqual(self.metrics.snapshot()['in_flight'][0]['value'], 1)
+
+    def test_histogram(self):
+        for value in (0.05, 0.1, 0.5, 2):
+            self.metrics.observe('callback_seconds', 'foo', value)
+        sample = self.metrics.snapshot()['callback_seconds'][0]
+        self.assertEqual(sample['count'], 4)
+        self.assertAlmostEqual(sample['sum'], 2.65)
+        self.assertEqual(sample['buckets'],
+                         {0.1: 2, 1: 3, float('inf'): 4})
+
+    def test_prometheus(self):
+        self.metrics.increment('received_total', 'f"oo')
+        self.metrics.observe('callback_seconds', 'foo', 0.5)
+        self.assertEqual(self.metrics.prometheus(), '\n'.join((
+            '# HELP qpid_bow_callback_seconds Duration of receive callbacks',
+            '# TYPE qpid_bow_callback_seconds histogram',
+            'qpid_bow_callback_seconds_bucket{address="foo",le="0.1"} 0',
+            'qpid_bow_callback_seconds_bucket{address="foo",le="1"} 1',
+            'qpid_bow_callback_seconds_bucket{address="foo",le="+Inf"} 1',
+            'qpid_bow_callback_seconds_sum{address="foo"} 0.5',
+            'qpid_bow_callback_seconds_count{address="foo"} 1',
+            '# HELP qpid_bow_received_total Messages received',
+            '# TYPE qpid_bow_received_total counter',
+            'qpid_bow_received_total{address="f\\"oo"} 1.0',
+        )) + '\n')
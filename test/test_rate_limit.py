@@ -0,0 +1,30 @@
+from time import sleep
+from unittest import TestCase
+
+from qpid_bow.rate_limit import TokenBucket
+
+
+class TestTokenBucket(TestCase):
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
+
+    def test_burst(self):
+        bucket = TokenBucket(10, burst=2)
+        self.assertEqual(bucket.wait_time(), 0)
+        bucket.consume(2)
+        self.assertEqual(bucket.wait_time(), 0)
+        bucket.consume()
+        self.assertGreater(bucket.wait_time(), 0)
+
+    def test_debt(self):
+        bucket = TokenBucket(1000)
+        bucket.consume(1500)
+        self.assertAlmostEqual(bucket.wait_time(), 0.5, places=1)
+
+    def test_refill(self):
+        bucket = TokenBucket(100, burst=1)
+        bucket.consume(2)
+        sleep(0.05)
+        self.assertEqual(bucket.wait_time(), 0)
+        self.assertEqual(bucket.tokens, 1)
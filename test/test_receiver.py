@@ -1,14 +1,52 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import timedelta
+from time import monotonic, sleep
+from unittest import TestCase
 from uuid import uuid4
 
-from qpid_bow.exc import TimeoutReached
+from proton import Endpoint, symbol
+
+from qpid_bow import RunState
+from qpid_bow.asyncio import Container as AsyncioContainer
+from qpid_bow.dedupe import DedupeWindow
+from qpid_bow.exc import RetriableMessage, TimeoutReached
+from qpid_bow.filters import link_filter
 from qpid_bow.management.queue import create_queue
 from qpid_bow.message import create_message
+from qpid_bow.metrics import Metrics
+from qpid_bow.receiver import (
+    AdaptivePrefetch,
+    BatchReceiver,
+    Receiver,
+    Settlement,
+)
+from qpid_bow.retry import RetryPolicy
 from qpid_bow.sender import Sender
 
 from . import MessagingTestBase
 
 
+def handle_message_in_process(message):
+    return message.body.startswith(b'FOOBAR')
+
+
+class SettleOrderReceiver(Receiver):
+    """Receiver recording the order deliveries are received and settled."""
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.deliveries = []
+        self.settled = []
+
+    def on_message(self, event):
+        self.deliveries.append(event.delivery)
+        super().on_message(event)
+
+    def settle(self, delivery, state=None):
+        self.settled.append(delivery)
+        super().settle(delivery, state)
+
+
 class TestReceiver(MessagingTestBase):
     def test_receive_timeout(self):
         with self.assertRaises(TimeoutReached):
@@ -39,6 +77,51 @@ class TestReceiver(MessagingTestBase):
         self.receive_messages()
         self.assertEqual(len(self.received_messages), len(expected_messages))
 
+    def test_add_addresses(self):
+        addresses = [uuid4().hex for _ in range(5)]
+        for address in addresses:
+            create_queue(address, durable=False, auto_delete=True,
+                         extra_properties={'qpid.auto_delete_timeout': 10})
+            sender = Sender(address)
+            sender.queue((create_message(address.encode()),))
+            sender.send()
+
+        self.receiver = Receiver(self.receiver.callback, sessions=3)
+        self.receiver.add_addresses(addresses)
+        self.receive_messages()
+        self.assertEqual(sorted(message.body
+                                for message in self.received_messages),
+                         sorted(address.encode() for address in addresses))
+
+    def test_remove_addresses(self):
+        addresses = [uuid4().hex for _ in range(3)]
+        for address in addresses:
+            create_queue(address, durable=False, auto_delete=True,
+                         extra_properties={'qpid.auto_delete_timeout': 10})
+
+        receiver = Receiver(self.receiver.callback, self.sender.address,
+                            sessions=2)
+        receiver.add_addresses(addresses)
+        receiver.open()
+        try:
+            receiver.process_until(lambda: all(
+                link and link.state & Endpoint.REMOTE_ACTIVE
+                for link in receiver.receivers.values()))
+            links = list(receiver.receivers.values())
+            # Spread round robin over the sessions
+            self.assertEqual([link.session for link in links],
+                             [links[0].session, links[1].session] * 2)
+            self.assertIsNot(links[0].session, links[1].session)
+
+            receiver.remove_addresses(addresses[1:])
+            receiver.process_until(lambda: all(
+                link.state & Endpoint.REMOTE_CLOSED for link in links[2:]))
+            self.assertEqual(list(receiver.receivers),
+                             [self.sender.address, addresses[0]])
+            self.assertTrue(links[1].state & Endpoint.REMOTE_ACTIVE)
+        finally:
+            receiver.close()
+
     def test_receive(self):
         self.send_messages((create_message(b'FOOBAR1'),
                             create_message(b'FOOBAR2'),
@@ -46,6 +129,348 @@ class TestReceiver(MessagingTestBase):
         self.receive_messages()
         self.check_messages()
 
+    def test_receive_compressed(self):
+        body = {'foo': 'bar' * 2048}
+        self.send_messages((create_message(body, compression='zlib'),))
+        self.receive_messages()
+        self.assertEqual(self.received_messages[0].body, body)
+        self.assertEqual(self.received_messages[0].content_encoding,
+                         symbol('None'))
+
+    def test_receive_prefetch(self):
+        self.receiver.prefetch = 1
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 20)])
+        self.receive_messages()
+        self.check_messages()
+
+    def test_receive_adaptive_prefetch(self):
+        self.receiver.prefetch = AdaptivePrefetch(max_credit=50)
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 200)])
+        self.receive_messages()
+        self.check_messages()
+        self.assertIsNotNone(self.receiver.prefetch.latency)
+
+    def test_receive_async_concurrent(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 20)])
+        running = []
+        peak_running = 0
+
+        async def handle_received_message(message):
+            nonlocal peak_running
+            running.append(message)
+            peak_running = max(peak_running, len(running))
+            await asyncio.sleep(0.01)
+            running.remove(message)
+            self.received_messages.append(message)
+            return True
+
+        async def wait_received():
+            while len(self.received_messages) < 20:
+                await asyncio.sleep(0.05)
+
+        receiver = Receiver(handle_received_message, self.sender.address,
+                            limit=20, container_class=AsyncioContainer,
+                            max_concurrency=5)
+        receiver.run()
+        asyncio.get_event_loop().run_until_complete(
+            asyncio.wait_for(wait_received(), 10))
+
+        self.assertGreater(peak_running, 1)
+        self.assertLessEqual(peak_running, 5)
+        self.assertEqual(sorted(message.body
+                                for message in self.received_messages),
+                         sorted(message.body
+                                for message in self.expected_messages))
+
+    def test_stop_cancels_async(self):
+        self.send_messages((create_message(b'FOOBAR1'),))
+        started = []
+        cancelled = []
+
+        async def handle_received_message(message):
+            started.append(message)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(message)
+                raise
+            return True
+
+        async def stop_started():
+            while not started:
+                await asyncio.sleep(0.01)
+            receiver.stop()
+            while not cancelled:
+                await asyncio.sleep(0.01)
+
+        receiver = Receiver(handle_received_message, self.sender.address,
+                            container_class=AsyncioContainer)
+        receiver.run()
+        asyncio.get_event_loop().run_until_complete(
+            asyncio.wait_for(stop_started(), 10))
+
+        # The message of the cancelled callback got released
+        self.assertFalse(receiver.tasks)
+        self.receive_messages()
+        self.check_messages()
+
+    def test_receive_lanes(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode(),
+                                           {'key': i % 3})
+                            for i in range(0, 30)])
+        running_keys = []
+        overlapping = False
+
+        async def handle_received_message(message):
+            nonlocal overlapping
+            key = message.properties['key']
+            self.assertNotIn(key, running_keys)
+            running_keys.append(key)
+            overlapping = overlapping or len(running_keys) > 1
+            await asyncio.sleep(0.01 * (3 - key))
+            running_keys.remove(key)
+            self.received_messages.append(message)
+            return True
+
+        async def wait_received():
+            while len(self.received_messages) < 30:
+                await asyncio.sleep(0.05)
+
+        receiver = Receiver(handle_received_message, self.sender.address,
+                            limit=30, container_class=AsyncioContainer,
+                            prefetch=30,
+                            lane_key=lambda message: message.properties['key'],
+                            lanes=3)
+        receiver.run()
+        asyncio.get_event_loop().run_until_complete(
+            asyncio.wait_for(wait_received(), 10))
+
+        self.assertTrue(overlapping)
+        for key in range(3):
+            self.assertEqual(
+                [message.body for message in self.received_messages
+                 if message.properties['key'] == key],
+                [message.body for message in self.expected_messages
+                 if message.properties['key'] == key])
+
+    def test_receive_lanes_key_error(self):
+        self.send_messages((create_message(b'FOOBAR1'),
+                            create_message(b'FOOBAR2', {'key': 1})))
+
+        async def handle_received_message(message):
+            self.received_messages.append(message)
+            return True
+
+        async def wait_settled():
+            while not self.received_messages or receiver.tasks:
+                await asyncio.sleep(0.05)
+
+        receiver = Receiver(handle_received_message, self.sender.address,
+                            container_class=AsyncioContainer,
+                            lane_key=lambda message: message.properties['key'])
+        receiver.run()
+        asyncio.get_event_loop().run_until_complete(
+            asyncio.wait_for(wait_settled(), 10))
+        receiver.stop()
+        self.assertEqual([message.body for message in self.received_messages],
+                         [b'FOOBAR2'])
+
+        # The message without key got rejected instead of redelivered
+        self.received_messages.clear()
+        self.receive_messages()
+        self.assertEqual([message.body for message in self.received_messages],
+                         [])
+
+    def test_lanes_synchronous_callback(self):
+        with self.assertRaises(ValueError):
+            Receiver(lambda message: True, self.sender.address,
+                     lane_key=lambda message: message.correlation_id)
+
+    def test_receive_selector(self):
+        self.send_messages((create_message(b'FOOBAR1', {'region': 'eu'}),
+                            create_message(b'FOOBAR2', {'region': 'us'}),
+                            create_message(b'FOOBAR3', {'region': 'eu'})))
+
+        address = self.sender.address
+        self.receiver.remove_address(address)
+        self.receiver.add_address(
+            address, options=[link_filter(selector="region = 'eu'")])
+        self.receive_messages()
+        self.assertEqual([message.body for message in self.received_messages],
+                         [b'FOOBAR1', b'FOOBAR3'])
+
+        # Unmatched messages remain on the queue
+        self.receiver.remove_address(address)
+        self.receiver.add_address(address)
+        self.receive_messages()
+        self.assertEqual(self.received_messages[-1].body, b'FOOBAR2')
+
+    def test_receive_duplicates(self):
+        self.receiver.dedupe_window = DedupeWindow(max_entries=10)
+        self.receiver.metrics = Metrics()
+        # Content IDs give both sends of the same message the same ID
+        self.sender = Sender(self.sender.address, content_ids=True)
+        message = create_message(b'FOOBAR1')
+        self.send_messages((message, message, create_message(b'FOOBAR2')))
+        self.receive_messages()
+
+        self.assertEqual([message.body for message in self.received_messages],
+                         [b'FOOBAR1', b'FOOBAR2'])
+        snapshot = self.receiver.metrics.snapshot()
+        self.assertEqual(snapshot['duplicates_total'][0]['value'], 1)
+        self.assertEqual(snapshot['settled_total'][0]['value'], 3)
+
+    def test_receive_lazy_body(self):
+        self.receiver.lazy_body = True
+        self.send_messages((create_message(b'FOOBAR1', {'skip': True}),
+                            create_message(b'FOOBAR2', {'skip': False})))
+        self.receive_messages()
+
+        self.assertFalse(self.received_messages[0].body_decoded)
+        self.assertEqual(self.received_messages[0].properties,
+                         {'skip': True})
+        self.assertEqual(self.received_messages[1].body, b'FOOBAR2')
+
+    def test_receive_metrics(self):
+        self.receiver.metrics = Metrics()
+        self.send_messages((create_message(b'FOOBAR1'),
+                            create_message(b'FOOBAR2')))
+        self.receive_messages()
+
+        snapshot = self.receiver.metrics.snapshot()
+        self.assertEqual(snapshot['received_total'][0]['value'], 2)
+        self.assertEqual(snapshot['settled_total'][0]['labels']['outcome'],
+                         'accepted')
+        self.assertEqual(snapshot['callback_seconds'][0]['count'], 2)
+
+    def test_receive_thread_pool(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 20)])
+
+        def handle_received_message(message):
+            sleep(0.01)
+            self.received_messages.append(message)
+            return True
+
+        with ThreadPoolExecutor(4) as executor:
+            self.receiver = Receiver(handle_received_message,
+                                     self.sender.address, executor=executor,
+                                     max_concurrency=4, ordered=True)
+            self.receive_messages()
+
+        self.assertEqual(sorted(message.body
+                                for message in self.received_messages),
+                         sorted(message.body
+                                for message in self.expected_messages))
+
+    def test_receive_thread_pool_ordered(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 8)])
+
+        def handle_received_message(message):
+            # Later messages complete first
+            sleep(0.1 - int(message.body[6:]) * 0.01)
+            self.received_messages.append(message)
+            return True
+
+        with ThreadPoolExecutor(4) as executor:
+            self.receiver = SettleOrderReceiver(
+                handle_received_message, self.sender.address,
+                executor=executor, max_concurrency=4, ordered=True)
+            self.receive_messages()
+
+        self.assertNotEqual([message.body
+                             for message in self.received_messages],
+                            [message.body
+                             for message in self.expected_messages])
+        self.assertEqual(self.receiver.settled, self.receiver.deliveries)
+        self.assertEqual(len(self.receiver.settled), 8)
+
+    def test_receive_process_pool(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 20)])
+        with ProcessPoolExecutor(2) as executor:
+            receiver = Receiver(handle_message_in_process,
+                                self.sender.address, executor=executor)
+            with self.assertRaises(TimeoutReached):
+                receiver.receive(timeout=timedelta(seconds=2))
+
+        # All messages got accepted
+        self.receive_messages()
+        self.assertEqual(len(self.received_messages), 0)
+
+    def test_receive_retry_policy(self):
+        attempts = []
+
+        def handle_received_message(message):
+            attempts.append(monotonic())
+            if message.delivery_count < 2:
+                raise RetriableMessage()
+            return True
+
+        self.send_messages((create_message(b'FOOBAR1'),))
+        self.receiver = Receiver(
+            handle_received_message, self.sender.address,
+            retry_policy=RetryPolicy(
+                max_attempts=5, initial_delay=timedelta(milliseconds=200),
+                jitter=0))
+        self.receive_messages()
+
+        self.assertEqual(len(attempts), 3)
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.2)
+        self.assertGreaterEqual(attempts[2] - attempts[1], 0.4)
+
+    def test_receive_retry_exhausted(self):
+        attempts = []
+
+        def handle_received_message(message):
+            attempts.append(message)
+            raise RetriableMessage()
+
+        self.send_messages((create_message(b'FOOBAR1'),))
+        self.receiver = Receiver(
+            handle_received_message, self.sender.address,
+            retry_policy=RetryPolicy(
+                max_attempts=2, initial_delay=timedelta(milliseconds=100)))
+        self.receive_messages()
+
+        # Rejected after the second attempt
+        self.assertEqual(len(attempts), 2)
+
+    def test_drain(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 20)])
+        started = []
+        completed = []
+
+        def handle_received_message(message):
+            started.append(message)
+            sleep(0.2)
+            completed.append(message)
+            return True
+
+        with ThreadPoolExecutor(2) as executor:
+            receiver = Receiver(handle_received_message, self.sender.address,
+                                executor=executor, max_concurrency=2)
+            receiver.open()
+            receiver.process_until(lambda: len(started) >= 2)
+            receiver.drain(timedelta(seconds=5))
+            receiver.process_until(
+                lambda: receiver.run_state == RunState.stopped)
+
+        # Running callbacks completed, all others got released
+        self.assertEqual(len(completed), len(started))
+        self.receive_messages()
+        self.assertEqual(len(self.received_messages), 20 - len(completed))
+
+    def test_executor_advanced_callback(self):
+        with self.assertRaises(ValueError):
+            Receiver(lambda message, delivery: True, self.sender.address,
+                     executor=ThreadPoolExecutor(1))
+
     def test_receive_limit(self):
         self.send_messages((create_message(b'FOOBAR1'),
                             create_message(b'FOOBAR2'),
@@ -60,3 +485,244 @@ class TestReceiver(MessagingTestBase):
         self.receiver.limit = None
         self.receive_messages()
         self.check_messages()
+
+
+class TestBatchReceiver(MessagingTestBase):
+    def setUp(self):
+        super().setUp()
+        self.batches = []
+        self.settlements = None
+
+        def handle_batch(messages):
+            self.batches.append(messages)
+            self.received_messages.extend(messages)
+            return self.settlements or True
+
+        self.receiver = BatchReceiver(handle_batch, self.sender.address,
+                                      batch_size=10)
+
+    def test_receive_batches(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 25)])
+        self.receive_messages()
+        self.check_messages()
+        self.assertEqual([len(batch) for batch in self.batches], [10, 10, 5])
+
+    def test_receive_batch_settlements(self):
+        self.settlements = [Settlement.accept, Settlement.reject,
+                            Settlement.release]
+        self.send_messages((create_message(b'FOOBAR1'),
+                            create_message(b'FOOBAR2'),
+                            create_message(b'FOOBAR3')))
+        # Stop before the released message gets redelivered
+        self.receiver.limit = 3
+        self.receive_messages()
+
+        # Only the released message gets redelivered
+        self.receiver.limit = None
+        self.settlements = None
+        self.received_messages.clear()
+        self.receive_messages()
+        self.assertEqual([message.body for message in self.received_messages],
+                         [b'FOOBAR3'])
+
+    def test_receive_async_window(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 40)])
+        running = []
+        peak_running = 0
+
+        async def handle_batch(messages):
+            nonlocal peak_running
+            first = not running and not self.received_messages
+            running.extend(messages)
+            peak_running = max(peak_running, len(running))
+            # Credit freed by the later batches must not let more run
+            # alongside the first
+            await asyncio.sleep(0.5 if first else 0.05)
+            for message in messages:
+                running.remove(message)
+            self.received_messages.extend(messages)
+            return True
+
+        async def wait_received():
+            while len(self.received_messages) < 40:
+                await asyncio.sleep(0.05)
+
+        receiver = BatchReceiver(handle_batch, self.sender.address,
+                                 limit=40, container_class=AsyncioContainer,
+                                 prefetch=10, batch_size=5)
+        receiver.run()
+        asyncio.get_event_loop().run_until_complete(
+            asyncio.wait_for(wait_received(), 10))
+
+        # Running batches are bounded by the credit window
+        self.assertGreater(peak_running, 5)
+        self.assertLessEqual(peak_running, 10)
+
+    def test_drain_async(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 25)])
+        completed = []
+
+        async def handle_batch(messages):
+            await asyncio.sleep(0.2)
+            completed.extend(messages)
+            return True
+
+        receiver = BatchReceiver(handle_batch, self.sender.address,
+                                 batch_size=10,
+                                 container_class=AsyncioContainer)
+        receiver.run()
+
+        async def drain():
+            while not receiver.tasks:
+                await asyncio.sleep(0.01)
+            receiver.drain(timedelta(seconds=5))
+            while receiver.run_state != RunState.stopped:
+                await asyncio.sleep(0.05)
+
+        asyncio.get_event_loop().run_until_complete(
+            asyncio.wait_for(drain(), 10))
+
+        # Running batches completed, all others got released
+        self.assertTrue(completed)
+        self.receive_messages()
+        self.assertEqual(len(self.received_messages), 25 - len(completed))
+
+
+class FakeLink:
+    """Receiver link holding one encoded message."""
+    is_receiver = True
+    state = Endpoint.LOCAL_ACTIVE | Endpoint.REMOTE_ACTIVE
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.advanced = False
+
+    def recv(self, size):
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+    def advance(self):
+        self.advanced = True
+
+
+class FakeDelivery:
+    partial = False
+
+    def __init__(self, link: FakeLink) -> None:
+        self.link = link
+
+    @property
+    def readable(self):
+        return not self.link.advanced
+
+    @property
+    def pending(self):
+        return len(self.link.data)
+
+
+class DeliveryEvent:
+    def __init__(self, data: bytes) -> None:
+        self.delivery = FakeDelivery(FakeLink(data))
+        self.message = None
+
+
+class MessageRecordingReceiver(Receiver):
+    """Receiver recording the messages of its message events."""
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.messages = []
+
+    def on_message(self, event):
+        self.messages.append(event.message)
+
+
+class TestReceiverDelivery(TestCase):
+    def setUp(self):
+        self.receiver = MessageRecordingReceiver(
+            lambda message: True, 'foo', server_url='amqp://127.0.0.1')
+        self.event = DeliveryEvent(create_message(b'FOOBAR').encode())
+
+    def test_delivery(self):
+        # Left to the IncomingMessageHandler
+        self.receiver.on_delivery(self.event)
+        self.assertEqual(self.receiver.messages, [])
+        self.assertFalse(self.event.delivery.link.advanced)
+
+    def test_delivery_lazy_body(self):
+        self.receiver.lazy_body = True
+        self.receiver.on_delivery(self.event)
+        self.assertEqual(len(self.receiver.messages), 1)
+        self.assertFalse(self.receiver.messages[0].body_decoded)
+        self.assertEqual(self.receiver.messages[0].body, b'FOOBAR')
+        # No longer readable for the IncomingMessageHandler
+        self.assertFalse(self.event.delivery.readable)
+
+
+class TestReceiverNotStarted(TestCase):
+    def test_drain(self):
+        for receiver_class in (Receiver, BatchReceiver):
+            receiver = receiver_class(lambda message: True, 'foo',
+                                      server_url='amqp://127.0.0.1')
+            receiver.drain()
+            self.assertEqual(receiver.run_state, RunState.stopped)
+            self.assertEqual(receiver.receivers, {'foo': None})
+
+
+class FakeContainer:
+    """Blocking container not connecting anywhere."""
+    def connect(self, **kwargs):
+        return None
+
+
+class StartEvent:
+    def __init__(self) -> None:
+        self.container = FakeContainer()
+
+
+class TestReceiverStart(TestCase):
+    def setUp(self):
+        async def handle_message(message):
+            return True
+
+        self.receiver = Receiver(handle_message,
+                                 server_url='amqp://127.0.0.1')
+        self.loop = asyncio.get_event_loop()
+
+    def test_start_async(self):
+        self.receiver.on_start(StartEvent())
+        self.assertFalse(self.receiver.concurrent)
+        self.assertIs(self.receiver.loop, self.loop)
+
+    def test_start_async_running_loop(self):
+        async def start():
+            self.receiver.on_start(StartEvent())
+
+        self.loop.run_until_complete(start())
+        # Callbacks can't be run until complete on the running loop
+        self.assertTrue(self.receiver.concurrent)
+        self.assertIs(self.receiver.loop, self.loop)
+
+
+class TestAdaptivePrefetch(TestCase):
+    def setUp(self):
+        self.prefetch = AdaptivePrefetch(
+            min_credit=2, max_credit=100,
+            target_buffer=timedelta(milliseconds=100), smoothing=0.5)
+
+    def test_unmeasured(self):
+        self.assertEqual(self.prefetch.window, 2)
+
+    def test_window(self):
+        self.prefetch.record(0.01)
+        self.assertEqual(self.prefetch.window, 10)
+        self.prefetch.record(0.03)
+        self.assertEqual(self.prefetch.window, 5)
+
+    def test_bounds(self):
+        self.prefetch.record(1)
+        self.assertEqual(self.prefetch.window, 2)
+        self.prefetch.latency = 0.00001
+        self.assertEqual(self.prefetch.window, 100)
@@ -0,0 +1,28 @@
+from datetime import timedelta
+from unittest import TestCase
+
+from qpid_bow.retry import RetryPolicy
+
+
+class TestRetryPolicy(TestCase):
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RetryPolicy(max_attempts=0)
+        with self.assertRaises(ValueError):
+            RetryPolicy(jitter=2)
+
+    def test_backoff(self):
+        policy = RetryPolicy(initial_delay=timedelta(seconds=1),
+                             max_delay=timedelta(seconds=5), jitter=0)
+        self.assertEqual([policy.delay(attempt) for attempt in range(1, 5)],
+                         [1, 2, 4, 5])
+
+    def test_max_attempts(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertIsNotNone(policy.delay(2))
+        self.assertIsNone(policy.delay(3))
+
+    def test_jitter(self):
+        policy = RetryPolicy(initial_delay=timedelta(seconds=10), jitter=0.5)
+        for _ in range(100):
+            self.assertTrue(5 <= policy.delay(1) <= 15)
@@ -0,0 +1,45 @@
+from datetime import timedelta
+from functools import partial
+from threading import Timer
+from unittest import TestCase
+
+from qpid_bow.message import create_message
+from qpid_bow.metrics import Metrics
+from qpid_bow.receiver import Receiver
+from qpid_bow.runner import ConsumerRunner, publish_settlements
+
+from . import MessagingTestBase
+
+
+def accept_message(message):
+    return message.body != b'REJECT'
+
+
+class TestConsumerRunner(MessagingTestBase):
+    def test_run(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 20)] +
+                           [create_message(b'REJECT')])
+        runner = ConsumerRunner(
+            partial(Receiver, accept_message, self.sender.address),
+            workers=2, drain_timeout=timedelta(seconds=5))
+        Timer(3, runner.stop).start()
+        runner.run()
+
+        self.assertEqual(runner.stats(),
+                         {'accepted': 20, 'rejected': 1, 'released': 0})
+        self.receive_messages()
+        self.assertEqual(len(self.received_messages), 0)
+
+
+class TestPublishSettlements(TestCase):
+    def test_publish(self):
+        metrics = Metrics()
+        metrics.increment('settled_total', 'foo', 'accepted', 2)
+        metrics.increment('settled_total', 'bar', 'accepted')
+        metrics.increment('settled_total', 'foo', 'released')
+        metrics.increment('received_total', 'foo', amount=3)
+
+        counters = [0] * 6
+        publish_settlements(metrics, counters, 3, [1, 0, 0])
+        self.assertEqual(counters, [0, 0, 0, 4, 0, 1])
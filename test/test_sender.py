@@ -1,13 +1,18 @@
+from datetime import timedelta
 from random import shuffle
-from time import sleep
+from time import monotonic, sleep
 from uuid import uuid4
 
 import pytest
 
-from qpid_bow import Priority, ReconnectStrategy
+from qpid_bow import Priority, ReconnectStrategy, RunState
+from qpid_bow.dedupe import DedupeWindow
 from qpid_bow.exc import UnroutableMessage
+from qpid_bow.management.queue import create_queue
 from qpid_bow.message import create_message
-from qpid_bow.sender import Sender
+from qpid_bow.metrics import Metrics
+from qpid_bow.rate_limit import TokenBucket
+from qpid_bow.sender import SendOutcome, Sender
 
 from . import MessagingTestBase
 
@@ -30,6 +35,258 @@ class TestSender(MessagingTestBase):
         self.receive_messages()
         self.check_messages()
 
+    def test_send_exceeding_credit(self):
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 500)])
+        self.receive_messages()
+        self.check_messages()
+
+    def test_send_generator(self):
+        messages = [create_message(f'FOOBAR{i}'.encode())
+                    for i in range(0, 50)]
+        self.expected_messages = messages
+        self.sender.queue(message for message in messages)
+        self.sender.send()
+        self.receive_messages()
+        self.check_messages()
+
+    def test_send_async_generator(self):
+        messages = [create_message(f'FOOBAR{i}'.encode())
+                    for i in range(0, 50)]
+
+        async def generate_messages():
+            for message in messages:
+                yield message
+
+        self.expected_messages = messages
+        self.sender.queue(generate_messages())
+        self.sender.send()
+        self.receive_messages()
+        self.check_messages()
+
+    def test_send_persistent(self):
+        sender = Sender(self.sender.address, persistent=True)
+        sender.queue((create_message(b'FOOBAR1'),))
+        sender.send()
+        connection = sender.connection
+
+        sender.queue((create_message(b'FOOBAR2'), create_message(b'FOOBAR3')))
+        sender.send()
+        self.assertIs(sender.connection, connection)
+        self.assertEqual(sender.run_state, RunState.connected)
+
+        sender.close()
+        self.assertEqual(sender.run_state, RunState.stopped)
+
+        self.receive_messages()
+        self.assertEqual([message.body for message in self.received_messages],
+                         [b'FOOBAR1', b'FOOBAR2', b'FOOBAR3'])
+
+    def test_close_persistent_unsent(self):
+        sender = Sender(self.sender.address, persistent=True)
+        sender.close()
+        self.assertEqual(sender.run_state, RunState.stopped)
+
+    def test_send_confirmed(self):
+        outcomes = []
+        in_flight = []
+
+        def handle_outcome(message, outcome):
+            in_flight.append(len(sender.unsettled))
+            outcomes.append((message, outcome))
+
+        messages = [create_message(f'FOOBAR{i}'.encode())
+                    for i in range(0, 20)]
+        sender = Sender(self.sender.address, confirm_window=5,
+                        confirm_callback=handle_outcome)
+        sender.queue(messages)
+        sender.send()
+
+        self.assertEqual(outcomes, [(message, SendOutcome.accepted)
+                                    for message in messages])
+        self.assertLess(max(in_flight), 5)
+        self.assertFalse(sender.unsettled)
+
+    def test_send_dedupe(self):
+        sender = Sender(self.sender.address,
+                        dedupe_window=DedupeWindow(max_entries=10))
+        sender.queue([create_message(b'FOOBAR1'),
+                      create_message(b'FOOBAR1'),
+                      create_message(b'FOOBAR2')])
+        sender.send()
+        sender.queue([create_message(b'FOOBAR2')])
+        sender.send()
+
+        self.receive_messages()
+        self.assertEqual([message.body for message in self.received_messages],
+                         [b'FOOBAR1', b'FOOBAR2'])
+
+    def test_send_dedupe_addressless(self):
+        second_queue_address = uuid4().hex
+        create_queue(second_queue_address, durable=False, auto_delete=True,
+                     extra_properties={'qpid.auto_delete_timeout': 10})
+
+        messages = []
+        for address in (self.sender.address, second_queue_address,
+                        second_queue_address):
+            message = create_message(b'FOOBAR1')
+            message.address = address
+            messages.append(message)
+
+        sender = Sender(dedupe_window=DedupeWindow(max_entries=10))
+        sender.queue(messages)
+        sender.send()
+
+        self.receiver.add_address(second_queue_address)
+        self.receive_messages()
+        self.assertEqual([message.body for message in self.received_messages],
+                         [b'FOOBAR1', b'FOOBAR1'])
+
+    def test_send_dedupe_confirmed(self):
+        outcomes = []
+        sender = Sender(self.sender.address, confirm_window=5,
+                        dedupe_window=DedupeWindow(max_entries=10),
+                        confirm_callback=lambda message, outcome:
+                        outcomes.append((message.body, outcome)))
+        sender.queue([create_message(b'FOOBAR1'),
+                      create_message(b'FOOBAR1')])
+        sender.send()
+        sender.queue([create_message(b'FOOBAR1')])
+        sender.send()
+
+        self.assertEqual(outcomes, [(b'FOOBAR1', SendOutcome.duplicate),
+                                    (b'FOOBAR1', SendOutcome.accepted),
+                                    (b'FOOBAR1', SendOutcome.duplicate)])
+
+    def test_dedupe_resend_released(self):
+        sender = Sender(self.sender.address, confirm_window=5,
+                        dedupe_window=DedupeWindow(max_entries=10))
+        message = create_message(b'FOOBAR1')
+        self.assertTrue(sender._assign_id(message))
+        self.assertFalse(sender._assign_id(message))
+
+        # Not accepted, so the message may be sent again
+        sender._settle_ids(message, False)
+        self.assertTrue(sender._assign_id(message))
+        sender._settle_ids(message, True)
+        self.assertFalse(sender._assign_id(message))
+
+    def test_send_metrics(self):
+        metrics = Metrics()
+        self.sender = Sender(self.sender.address, confirm_window=10,
+                             metrics=metrics)
+        self.send_messages((create_message(b'FOOBAR1'),
+                            create_message(b'FOOBAR2')))
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['sent_total'][0]['value'], 2)
+        self.assertEqual(snapshot['confirmed_total'][0],
+                         {'labels': {'address': self.sender.address,
+                                     'outcome': 'accepted'},
+                          'value': 2})
+        self.assertEqual(snapshot['unsettled'][0]['value'], 0)
+
+    def test_send_metrics_addressless(self):
+        second_queue_address = uuid4().hex
+        create_queue(second_queue_address, durable=False, auto_delete=True,
+                     extra_properties={'qpid.auto_delete_timeout': 10})
+        messages = []
+        for address in (self.sender.address, second_queue_address):
+            message = create_message(b'FOOBAR')
+            message.address = address
+            messages.append(message)
+
+        metrics = Metrics()
+        sender = Sender(link_pool_size=2, confirm_window=10, metrics=metrics)
+        sender.queue(messages)
+        sender.send()
+
+        unsettled = {sample['labels']['address']: sample['value']
+                     for sample in metrics.snapshot()['unsettled']}
+        self.assertEqual(unsettled, {self.sender.address: 0,
+                                     second_queue_address: 0})
+
+    def test_send_presettled(self):
+        sender = Sender(self.sender.address, persistent=True,
+                        presettled=True)
+        settled = []
+        sender.on_settled = settled.append
+        messages = [create_message(f'FOOBAR{i}'.encode())
+                    for i in range(0, 50)]
+        self.expected_messages.extend(messages)
+        sender.queue(messages)
+        sender.send()
+
+        # Settled on sending, the broker sends no dispositions
+        self.assertEqual(sender.sender_link.unsettled, 0)
+        sender.close()
+        self.assertEqual(settled, [])
+        self.receive_messages()
+        self.check_messages()
+
+    def test_presettled_confirm_window(self):
+        with self.assertRaises(ValueError):
+            Sender(self.sender.address, presettled=True, confirm_window=10)
+
+    def test_send_rate_limited(self):
+        self.sender = Sender(self.sender.address,
+                             rate_limit=TokenBucket(100, burst=10))
+        start = monotonic()
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 60)])
+        self.assertGreaterEqual(monotonic() - start, 0.45)
+        self.receive_messages()
+        self.check_messages()
+
+    def test_send_batched(self):
+        self.sender = Sender(self.sender.address, batch_max_bytes=256)
+        self.send_messages([create_message(f'FOOBAR{i}'.encode())
+                            for i in range(0, 100)])
+        self.receive_messages()
+        self.check_messages()
+
+    def test_send_batched_linger(self):
+        sender = Sender(self.sender.address, persistent=True,
+                        batch_max_bytes=1024,
+                        batch_linger=timedelta(seconds=10))
+        sender.queue([create_message(b'FOOBAR1')])
+        sender.send()
+        sender.queue([create_message(b'FOOBAR2')])
+        sender.send()
+        self.assertEqual(len(sender.batches[None]), 2)
+        sender.close()
+
+        self.receive_messages()
+        self.assertEqual([message.body for message in self.received_messages],
+                         [b'FOOBAR1', b'FOOBAR2'])
+
+    def test_send_batched_linger_addresses(self):
+        second_queue_address = uuid4().hex
+        create_queue(second_queue_address, durable=False, auto_delete=True,
+                     extra_properties={'qpid.auto_delete_timeout': 10})
+        sender = Sender(persistent=True, batch_max_bytes=1024,
+                        batch_linger=timedelta(milliseconds=200))
+        for address in (self.sender.address, second_queue_address):
+            message = create_message(address.encode())
+            message.address = address
+            sender.queue([message])
+            sender.send()
+            sleep(0.1)
+
+        # Both batches get flushed by linger timers, without sending again
+        deadline = monotonic() + 5
+        sender.process_until(
+            lambda: not sender.batches or monotonic() > deadline)
+        self.assertEqual(sender.batches, {})
+        sender.close()
+
+        self.receiver.add_address(second_queue_address)
+        self.receive_messages()
+        self.assertEqual(
+            sorted(message.body for message in self.received_messages),
+            sorted(address.encode() for address
+                   in (self.sender.address, second_queue_address)))
+
     def test_send_priorities(self):
         messages_to_send = []
         for i in range(0, 30):
@@ -63,8 +320,36 @@ class TestSender(MessagingTestBase):
         self.receive_messages()
         self.check_messages()
 
+    def test_addressless_link_pool(self):
+        second_queue_address = uuid4().hex
+        create_queue(second_queue_address, durable=False, auto_delete=True,
+                     extra_properties={'qpid.auto_delete_timeout': 10})
+
+        messages = []
+        for i in range(0, 10):
+            for address in (self.sender.address, second_queue_address):
+                message = create_message(f'FOOBAR{i}'.encode())
+                message.address = address
+                messages.append(message)
+
+        sender = Sender(link_pool_size=1)
+        sender.queue(messages)
+        sender.send()
+
+        self.receiver.add_address(second_queue_address)
+        self.receive_messages()
+        self.assertEqual(
+            sorted(message.body for message in self.received_messages),
+            sorted(message.body for message in messages))
+
     def test_addressless_unroutable(self):
         with self.assertRaises(UnroutableMessage):
             sender = Sender()
             message = create_message(b'FOOBAR')
             sender.queue((message,))
+
+    def test_addressless_unroutable_generator(self):
+        sender = Sender()
+        sender.queue(create_message(b'FOOBAR') for _ in range(0, 3))
+        with self.assertRaises(UnroutableMessage):
+            sender.send()